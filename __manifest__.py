@@ -1,6 +1,6 @@
 {
     'name': 'BOM ZNS Integration',
-    'version': '1.0',
+    'version': '1.1',
     'category': 'Marketing',
     'summary': 'Integration with Zalo ZNS via BOM Communications API',
     'author': 'BOM Communications',
@@ -10,6 +10,7 @@
         'base',
         'mail',
         'web',
+        'portal',
         'contacts',
         'sale',
         'crm',
@@ -30,8 +31,11 @@
         'views/bom_zns_history_views.xml',
         'views/bom_zns_dashboard_views.xml',
         'views/bom_zns_variant_views.xml',
+        'views/bom_zns_stats_views.xml',
+        'views/bom_zns_history_archive_views.xml',
         'views/res_config_settings_views.xml',
         'views/res_partner_views.xml',
+        'views/portal_templates.xml',
         'views/menu_views.xml',
         #'views/sale_order_views.xml',
         #'views/account_move_views.xml',
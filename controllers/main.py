@@ -1,85 +1,71 @@
 import logging
 import json
 import werkzeug
-from odoo import http
+from dateutil.relativedelta import relativedelta
+from odoo import fields, http
 from odoo.http import request
 
 _logger = logging.getLogger(__name__)
 
 class BomZnsController(http.Controller):
+    def _ingest_webhook(self, data):
+        """Store webhook events for the background worker
+        
+        :param data: A single event, a list of events or a dictionary with
+                     an 'events' list
+        """
+        if isinstance(data, dict) and isinstance(data.get('events'), list):
+            events = data['events']
+        elif isinstance(data, list):
+            events = data
+        else:
+            events = [data]
+        
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(f"ZNS Webhook data: {json.dumps(data)}")
+        
+        accepted, rejected = request.env['bom.zns.webhook.event'].sudo()._ingest(events)
+        if not accepted:
+            return {'status': 'error', 'message': 'No valid event received (message_id and status are required)'}
+        return {'status': 'success', 'message': 'Event received', 'accepted': accepted, 'rejected': rejected}
+    
     @http.route('/bom/zns/webhook', type='json', auth='none', csrf=False, methods=['POST'])
     def webhook(self, **post):
         """Handle BOM ZNS webhook for status updates"""
         # Get data from request
         data = request.jsonrequest
         
-        # Log request if possible
-        try:
-            # Get configuration for debug mode
-            config = request.env['bom.zns.config'].sudo().search([('active', '=', True)], limit=1)
-            if config and config.debug_mode:
-                _logger.info(f"ZNS Webhook data: {json.dumps(data)}")
-        except Exception as e:
-            _logger.error(f"Error logging webhook data: {str(e)}")
-        
         # Validate data
         if not data:
             return {'status': 'error', 'message': 'No data received'}
         
-        message_id = data.get('message_id')
-        if not message_id:
-            return {'status': 'error', 'message': 'No message_id provided'}
-        
-        # Get the status
-        status = data.get('status')
-        if not status:
-            return {'status': 'error', 'message': 'No status provided'}
-        
-        # Process the status update
         try:
-            # Find the message history
-            history = request.env['bom.zns.history'].sudo().search([('message_id', '=', message_id)], limit=1)
-            if not history:
-                return {'status': 'error', 'message': 'Message not found'}
-            
-            # Update status based on the webhook data
-            vals = {'bom_response': json.dumps(data)}
-            
-            if status == 'delivered':
-                vals.update({
-                    'state': 'delivered',
-                    'delivery_date': fields.Datetime.now(),
-                })
-            elif status == 'read':
-                vals.update({
-                    'state': 'read',
-                    'delivery_date': history.delivery_date or fields.Datetime.now(),
-                    'read_date': fields.Datetime.now(),
-                })
-            elif status == 'failed':
-                vals.update({
-                    'state': 'failed',
-                    'error_message': data.get('message', 'Failed to deliver message'),
-                })
-            
-            # Update the history record
-            history.write(vals)
-            
-            return {'status': 'success', 'message': 'Status updated'}
-        
+            return self._ingest_webhook(data)
         except Exception as e:
             _logger.exception(f"Error processing ZNS webhook: {str(e)}")
             return {'status': 'error', 'message': str(e)}
     
+    @http.route('/bom/zns/webhook/batch', type='http', auth='none', csrf=False, methods=['POST'])
+    def webhook_batch(self, **post):
+        """Handle BOM ZNS webhook posting a raw JSON array of status updates"""
+        try:
+            data = json.loads(request.httprequest.get_data() or b'null')
+            if not data:
+                result = {'status': 'error', 'message': 'No data received'}
+            else:
+                result = self._ingest_webhook(data)
+        except Exception as e:
+            _logger.exception(f"Error processing ZNS webhook: {str(e)}")
+            result = {'status': 'error', 'message': str(e)}
+        
+        return request.make_response(json.dumps(result), headers=[('Content-Type', 'application/json')])
+    
     @http.route('/bom/zns/status/<string:message_id>', type='http', auth='user')
     def check_status(self, message_id, **kwargs):
         """Check and update status of a specific message"""
         try:
-            # Create ZNS API instance
-            zns_api = request.env['bom.zns'].sudo().create({})
-            
             # Check message status
-            result = zns_api.check_message_status(message_id)
+            result = request.env['bom.zns'].sudo().check_message_status(message_id)
             
             # Redirect to the message history
             if result.get('history_id'):
@@ -98,53 +84,62 @@ class BomZnsDashboardController(http.Controller):
         try:
             # Get statistics for dashboard
             History = request.env['bom.zns.history'].sudo()
-            Template = request.env['bom.zns.template'].sudo()
+            Stats = request.env['bom.zns.stats.daily'].sudo()
             
-            # Get counts by state
-            state_counts = {}
-            for state in ['draft', 'sent', 'delivered', 'read', 'failed']:
-                state_counts[state] = History.search_count([('state', '=', state)])
+            # Get counts by state from the daily statistics, whose counters
+            # are cumulative along sent, delivered and read
+            counters = ['total_count', 'queued_count', 'sent_count', 'delivered_count', 'read_count', 'failed_count']
+            totals = Stats.read_group([], counters, [])[0]
+            total, queued, sent, delivered, read, failed = (totals.get(name) or 0 for name in counters)
+            state_counts = {
+                'draft': total - queued - sent - failed,
+                'queued': queued,
+                'sent': sent - delivered,
+                'delivered': delivered - read,
+                'read': read,
+                'failed': failed,
+            }
             
-            # Get template usage
+            # Get template usage from the daily statistics
             template_usage = []
-            templates = Template.search([])
-            for template in templates:
-                count = History.search_count([('template_id', '=', template.id)])
-                if count > 0:
+            for group in Stats.read_group([('template_id', '!=', False)], ['total_count'], ['template_id']):
+                if group['total_count']:
                     template_usage.append({
-                        'template_name': template.name,
-                        'count': count,
+                        'template_name': group['template_id'][1],
+                        'count': group['total_count'],
                     })
             
             # Get recent messages
             recent_messages = []
-            messages = History.search([], order='create_date desc', limit=10)
+            messages = History.search_read(
+                [], ['message_id', 'template_id', 'partner_id', 'phone', 'state', 'create_date'],
+                order='id desc', limit=10)
             for message in messages:
                 recent_messages.append({
-                    'id': message.id,
-                    'message_id': message.message_id,
-                    'template_name': message.template_id.name if message.template_id else 'Unknown',
-                    'recipient': message.partner_id.name if message.partner_id else message.phone,
-                    'state': message.state,
-                    'create_date': message.create_date,
+                    'id': message['id'],
+                    'message_id': message['message_id'],
+                    'template_name': message['template_id'][1] if message['template_id'] else 'Unknown',
+                    'recipient': message['partner_id'][1] if message['partner_id'] else message['phone'],
+                    'state': message['state'],
+                    'create_date': message['create_date'],
                 })
             
-            # Get monthly stats (last 6 months)
+            # Get monthly stats (last 6 months) from the daily statistics
+            first_month = fields.Date.today().replace(day=1) - relativedelta(months=5)
+            request.env.cr.execute("""
+                SELECT date_trunc('month', day)::date, sum(total_count)
+                  FROM bom_zns_stats_daily
+                 WHERE day >= %s
+              GROUP BY 1
+            """, (first_month,))
+            month_counts = dict(request.env.cr.fetchall())
+            
             monthly_stats = []
-            for i in range(5, -1, -1):
-                # Calculate date range for month
-                start_date = (fields.Date.today() - relativedelta(months=i))
-                end_date = (fields.Date.today() - relativedelta(months=i-1))
-                
-                # Get counts for the month
-                month_count = History.search_count([
-                    ('create_date', '>=', start_date),
-                    ('create_date', '<', end_date),
-                ])
-                
+            for i in range(6):
+                month = first_month + relativedelta(months=i)
                 monthly_stats.append({
-                    'month': start_date.strftime('%B %Y'),
-                    'count': month_count,
+                    'month': month.strftime('%B %Y'),
+                    'count': month_counts.get(month, 0),
                 })
             
             return {
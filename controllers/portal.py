@@ -1,5 +1,7 @@
 import logging
-from odoo import http, _
+from datetime import datetime
+from werkzeug.urls import url_encode
+from odoo import fields, http, _
 from odoo.http import request
 from odoo.addons.portal.controllers.portal import CustomerPortal, pager as portal_pager
 
@@ -11,24 +13,29 @@ class BomZnsPortal(CustomerPortal):
         values = super()._prepare_home_portal_values(counters)
         
         if 'zns_count' in counters:
-            partner = request.env.user.partner_id
-            values['zns_count'] = request.env['bom.zns.history'].sudo().search_count([
-                ('partner_id', '=', partner.id)
-            ])
+            # Counter stored on the partner and maintained by the message history
+            values['zns_count'] = request.env.user.partner_id.sudo().zns_history_count
         
         return values
     
     @http.route(['/my/zns', '/my/zns/page/<int:page>'], type='http', auth="user", website=True)
-    def portal_my_zns(self, page=1, date_begin=None, date_end=None, sortby=None, filterby=None, **kw):
-        """Display ZNS messages in customer portal"""
+    def portal_my_zns(self, page=1, date_begin=None, date_end=None, sortby=None, filterby=None, after=None, **kw):
+        """Display ZNS messages in customer portal
+        
+        The default, newest first listing is paginated by keyset: the next
+        page starts after the (create_date, id) of the last message shown,
+        given in the 'after' parameter, so deep pages cost the same as the
+        first one. The other sortings use the regular pager.
+        """
         values = self._prepare_portal_layout_values()
         partner = request.env.user.partner_id
         BomZnsHistory = request.env['bom.zns.history'].sudo()
         
         domain = [('partner_id', '=', partner.id)]
         
-        # Archive groups - Default Group By 'create_date'
-        archive_groups = self._get_archive_groups('bom.zns.history', domain)
+        # Archive groups - Default Group By 'create_date', cached per partner
+        # until a message is added or removed
+        archive_groups = BomZnsHistory._get_portal_archive_groups(partner.id, partner.sudo().zns_history_count)
         
         # Date filtering
         if date_begin and date_end:
@@ -36,9 +43,9 @@ class BomZnsPortal(CustomerPortal):
         
         # Sorting
         searchbar_sortings = {
-            'date': {'label': _('Newest'), 'order': 'create_date desc'},
-            'name': {'label': _('Template'), 'order': 'template_id'},
-            'status': {'label': _('Status'), 'order': 'state'},
+            'date': {'label': _('Newest'), 'order': 'create_date desc, id desc'},
+            'name': {'label': _('Template'), 'order': 'template_code, id desc'},
+            'status': {'label': _('Status'), 'order': 'state, id desc'},
         }
         
         # Default sorting
@@ -59,26 +66,51 @@ class BomZnsPortal(CustomerPortal):
             filterby = 'all'
         domain += searchbar_filters[filterby]['domain']
         
-        # Count for pager
-        zns_count = BomZnsHistory.search_count(domain)
-        
-        # Pager
-        pager = portal_pager(
-            url="/my/zns",
-            url_args={'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'filterby': filterby},
-            total=zns_count,
-            page=page,
-            step=self._items_per_page
-        )
-        
-        # Content
-        messages = BomZnsHistory.search(domain, order=order, limit=self._items_per_page, offset=pager['offset'])
+        url_args = {'date_begin': date_begin, 'date_end': date_end, 'sortby': sortby, 'filterby': filterby}
+        step = self._items_per_page
+        pager = False
+        next_url = False
+        if sortby == 'date':
+            # Keyset pagination
+            after_key = self._parse_zns_cursor(after)
+            if after_key:
+                after_date, after_id = after_key
+                domain += ['|', ('create_date', '<', after_date),
+                           '&', ('create_date', '=', after_date), ('id', '<', after_id)]
+            messages = BomZnsHistory.search(domain, order=order, limit=step + 1)
+            if len(messages) > step:
+                messages = messages[:step]
+                last = messages[-1]
+                # Keep the microseconds, messages are often created in the same second
+                cursor = f"{last.create_date.isoformat()}|{last.id}"
+                next_url = "/my/zns?%s" % url_encode(dict(
+                    {key: value for key, value in url_args.items() if value}, after=cursor))
+        else:
+            # Count for pager
+            zns_count = BomZnsHistory.search_count(domain)
+            
+            # Pager
+            pager = portal_pager(
+                url="/my/zns",
+                url_args=url_args,
+                total=zns_count,
+                page=page,
+                step=step
+            )
+            
+            # Content
+            messages = BomZnsHistory.search(domain, order=order, limit=step, offset=pager['offset'])
+        
+        # Template names of the whole page, read at once
+        template_names = {template.id: template.name for template in messages.mapped('template_id')}
         
         values.update({
             'date': date_begin,
             'messages': messages,
+            'template_names': template_names,
             'page_name': 'zns',
             'pager': pager,
+            'next_url': next_url,
             'archive_groups': archive_groups,
             'default_url': '/my/zns',
             'searchbar_sortings': searchbar_sortings,
@@ -87,7 +119,20 @@ class BomZnsPortal(CustomerPortal):
             'filterby': filterby,
         })
         
-        return request.render("bom.portal_my_zns", values)
+        return request.render("bom_zns_simple.portal_my_zns", values)
+    
+    def _parse_zns_cursor(self, after):
+        """Parse a keyset pagination cursor
+        
+        :return: Tuple (create_date, id), or None if the cursor is invalid
+        """
+        if not after:
+            return None
+        try:
+            date_string, history_id = after.rsplit('|', 1)
+            return datetime.fromisoformat(date_string), int(history_id)
+        except (ValueError, TypeError):
+            return None
     
     @http.route(['/my/zns/<int:zns_id>'], type='http', auth="user", website=True)
     def portal_my_zns_detail(self, zns_id, **kw):
@@ -117,4 +162,4 @@ class BomZnsPortal(CustomerPortal):
             'page_name': 'zns',
         }
         
-        return request.render("bom.portal_my_zns_detail", values)
\ No newline at end of file
+        return request.render("bom_zns_simple.portal_my_zns_detail", values)
\ No newline at end of file
@@ -0,0 +1,9 @@
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # Backfill the daily statistics from the existing history
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    env['bom.zns.stats.daily'].rebuild_stats()
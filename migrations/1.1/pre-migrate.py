@@ -0,0 +1,25 @@
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    # Placeholder IDs stored when BOM did not return one
+    cr.execute("""
+        UPDATE bom_zns_history SET message_id = NULL
+         WHERE message_id IN ('', 'Unknown')
+    """)
+    # Version 1.0 also wrote the ID of a successful retry on both the original
+    # message and the new one: keep it on the newest only, so the unique
+    # index on message_id can be built
+    cr.execute("""
+        UPDATE bom_zns_history h SET message_id = NULL
+          FROM (SELECT id, row_number() OVER (PARTITION BY message_id ORDER BY id DESC) AS rank
+                  FROM bom_zns_history
+                 WHERE message_id IS NOT NULL) d
+         WHERE h.id = d.id
+           AND d.rank > 1
+    """)
+    _logger.info("Cleared %s duplicate ZNS message ID(s)", cr.rowcount)
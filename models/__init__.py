@@ -3,9 +3,15 @@ from . import bom_zns
 from . import bom_zns_config
 from . import bom_zns_template
 from . import bom_zns_history
+from . import bom_zns_history_event
+from . import bom_zns_history_archive
 from . import bom_zns_variant
+from . import bom_zns_stats_daily
+from . import bom_zns_webhook_event
+from . import bom_zns_rate_limit
 from . import res_config_settings
 from . import res_partner
 from . import sale_order
 from . import account_move
-from . import crm_lead
\ No newline at end of file
+from . import crm_lead
+from . import crm_stage
\ No newline at end of file
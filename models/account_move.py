@@ -30,52 +30,20 @@ class AccountMove(models.Model):
         result = super(AccountMove, self)._post(soft=soft)
         
         # Check if auto-send is enabled in config
-        IrConfig = self.env['ir.config_parameter'].sudo()
-        if IrConfig.get_param('bom_zns_simple.auto_send_invoice', 'False').lower() == 'true':
-            for invoice in self.filtered(lambda m: m.move_type == 'out_invoice' and m.state == 'posted'):
-                invoice._send_invoice_confirmed_zns()
+        settings = self.env['bom.zns.config']._get_company_settings(self.env.company.id)
+        if settings['auto_send_invoice']:
+            invoices = self.filtered(lambda m: m.move_type == 'out_invoice' and m.state == 'posted')
+            self.env['bom.zns']._schedule_auto_send(invoices, 'invoice_template_id')
             
         return result
     
+    def _filter_zns_auto_send(self):
+        """Get the invoices still eligible for their invoice ZNS"""
+        return self.filtered(lambda move: move.state == 'posted')
+    
     def _send_invoice_confirmed_zns(self):
-        self.ensure_one()
-        if self.zns_sent:
-            return
-            
-        # Get template from settings
-        IrConfig = self.env['ir.config_parameter'].sudo()
-        template_id = int(IrConfig.get_param('bom_zns_simple.invoice_template_id', '0'))
-        if not template_id:
-            return
-            
-        template = self.env['bom.zns.template'].browse(template_id).exists()
-        if not template or not self.partner_id or not self.partner_id.zalo_opt_in:
-            return
-            
-        # Get phone number
-        phone = self.partner_id.zalo_phone or self.partner_id.mobile or self.partner_id.phone
-        if not phone:
-            return
-            
-        # Prepare parameters
-        params = {}
-        for variant in template.variant_ids.filtered(lambda v: v.active):
-            params[variant.param_name] = variant.get_formatted_value(record=self)
-        
-        # Send ZNS
-        zns_api = self.env['bom.zns'].create({})
-        result = zns_api.send_zns_message(
-            template_id=template.id,
-            phone=phone,
-            params=params,
-            partner_id=self.partner_id.id,
-            model='account.move',
-            res_id=self.id,
-            is_test=False
-        )
-        
-        if result.get('success'):
-            self.zns_sent = True
+        """Queue the invoice ZNS of these invoices right away"""
+        self.env['bom.zns']._enqueue_auto_send(self, 'invoice_template_id')
     
     def action_send_zns(self):
         """Manual ZNS sending action"""
@@ -1,21 +1,94 @@
 import logging
 import json
-import requests
-from datetime import datetime
-from odoo import api, fields, models, _
+import hashlib
+import queue
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from psycopg2 import IntegrityError
+from odoo import api, fields, models, tools, SUPERUSER_ID, _
 from odoo.exceptions import UserError, ValidationError
+from odoo.modules.registry import Registry
 
 _logger = logging.getLogger(__name__)
 
+
+def _call_api(session, method, url, payload=None, timeout=30, headers=None):
+    """Call the BOM API and return the raw answer
+    
+    Runs in worker threads, so it must not touch the ORM.
+    
+    :param headers: Optional headers added to those of the session
+    :return: Tuple (status code, response text, exception)
+    """
+    try:
+        response = session.request(method, url, json=payload, timeout=timeout, headers=headers)
+        return response.status_code, response.text, None
+    except Exception as e:
+        return None, None, e
+
+# HTTP statuses that mean the request may succeed if sent again later
+RETRYABLE_STATUS = {408, 425, 429}
+
+def _is_retryable(status_code):
+    """Whether a sending error is temporary and worth retrying
+    
+    :param status_code: HTTP status of the answer, None if there was none
+    """
+    return status_code is None or status_code in RETRYABLE_STATUS or status_code >= 500
+
+def _dispatch_in_background(dbname, context, history_ids):
+    """Send messages queued by a committed transaction
+    
+    Runs in the background dispatcher thread with its own cursor, as
+    superuser like the dispatcher cron: the queueing flow may have run as a
+    portal or public user through sudo(). Anything left queued, e.g. if the
+    worker stops, is sent later by the dispatcher cron.
+    """
+    try:
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, context)
+            Zns = env['bom.zns']
+            IrConfig = env['ir.config_parameter'].sudo()
+            batch_size = int(IrConfig.get_param('bom_zns_simple.dispatch_batch_size', '100'))
+            histories = Zns._claim_queued_messages(batch_size, history_ids=history_ids)
+            if histories:
+                Zns._dispatch_messages(histories)
+    except Exception:
+        _logger.exception("Post-commit ZNS dispatch failed, the dispatcher cron will send the messages")
+
+# Committed batches waiting for the background dispatcher of this process
+_dispatch_queue = queue.Queue()
+_dispatch_thread = None
+_dispatch_lock = threading.Lock()
+
+def _run_background_dispatcher():
+    while True:
+        dbname, context, history_ids = _dispatch_queue.get()
+        _dispatch_in_background(dbname, context, history_ids)
+
+def _queue_background_dispatch(dbname, context, history_ids):
+    """Hand messages of a committed transaction to the background dispatcher
+    
+    A single dispatcher thread per process sends the batches one after the
+    other, so a burst of transactions uses one cursor and one pool of send
+    workers at a time instead of one of each per transaction.
+    """
+    global _dispatch_thread
+    _dispatch_queue.put((dbname, context, history_ids))
+    with _dispatch_lock:
+        if _dispatch_thread is None or not _dispatch_thread.is_alive():
+            _dispatch_thread = threading.Thread(
+                target=_run_background_dispatcher, name='bom_zns_dispatch', daemon=True)
+            _dispatch_thread.start()
+
 class BomZns(models.Model):
     _name = 'bom.zns'
     _description = 'BOM ZNS API'
     
     def _default_config_id(self):
-        return self.env['bom.zns.config'].search([
-            ('company_id', '=', self.env.company.id),
-            ('active', '=', True)
-        ], limit=1).id
+        return self.env['bom.zns.config']._get_company_config_id(self.env.company.id)
     
     name = fields.Char('Name', default="ZNS API")
     company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
@@ -32,27 +105,29 @@ class BomZns(models.Model):
             'context': {},
         }
     
-    def send_zns_message(self, template_id, phone, params=None, partner_id=False, model=False, res_id=False, is_test=False):
-        """Send ZNS message using BOM API
+    def _resolve_template(self, template_id):
+        """Get the template and configuration used to send a message
         
-        :param template_id: ID of the bom.zns.template to use
-        :param phone: Phone number of the recipient
-        :param params: Dictionary of parameters to use in the template
-        :param partner_id: Optional partner ID for tracking
-        :param model: Optional model name for reference
-        :param res_id: Optional record ID for reference
-        :param is_test: Whether this is a test message
-        :return: Dictionary with status and message information
+        :return: Tuple (template, config, error message)
         """
         template = self.env['bom.zns.template'].browse(template_id).exists()
         if not template:
-            return {'success': False, 'error': _("Template not found.")}
+            return template, None, _("Template not found.")
         
         # Get configuration
         config = template.config_id or self.env['bom.zns.config'].get_bom_zns_config()
         if not config:
-            return {'success': False, 'error': _("ZNS Configuration not found.")}
+            return template, config, _("ZNS Configuration not found.")
         
+        return template, config, None
+    
+    def _prepare_history_vals(self, template, config, phone, params=None, partner_id=False, model=False, res_id=False, is_test=False):
+        """Build the history values of a message to send
+        
+        In compact payload storage, the request is not stored since it is
+        rebuilt from the template code, the phone and the parameters, and
+        debug information is only stored in debug mode.
+        """
         # Prepare parameters
         if params is None:
             params = {}
@@ -60,6 +135,26 @@ class BomZns(models.Model):
         # Format phone number (remove '+' if present)
         phone = (phone or '').replace('+', '')
         
+        vals = {
+            'template_id': template.id,
+            'partner_id': partner_id,
+            'company_id': self.env.company.id,
+            'config_id': config.id,
+            'phone': phone,
+            'message_params': json.dumps(params),
+            'model': model,
+            'res_id': res_id,
+            'is_test': is_test,
+            'state': 'draft',
+            'user_id': self.env.user.id,
+        }
+        
+        if config.payload_storage == 'compact':
+            if config.debug_mode:
+                # The history columns hold everything else of the full debug information
+                vals['debug_information'] = json.dumps({'timestamp': datetime.now().isoformat()})
+            return vals
+        
         # Prepare request data
         request_data = {
             'template_id': template.template_code,
@@ -78,211 +173,770 @@ class BomZns(models.Model):
             'timestamp': datetime.now().isoformat(),
         }
         
-        # Prepare headers
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Api-Key': config.api_key,
-            'X-Api-Secret': config.api_secret,
-        }
-        
-        # Create history record
-        history_vals = {
-            'template_id': template.id,
-            'partner_id': partner_id,
-            'company_id': self.env.company.id,
-            'config_id': config.id,
-            'phone': phone,
-            'message_params': json.dumps(params),
-            'model': model,
-            'res_id': res_id,
-            'is_test': is_test,
-            'state': 'draft',
-            'user_id': self.env.user.id,
+        vals.update({
             'request_data': json.dumps(request_data),
             'debug_information': json.dumps(debug_info),
+        })
+        return vals
+    
+    @api.model
+    def send_zns_message(self, template_id, phone, params=None, partner_id=False, model=False, res_id=False, is_test=False,
+                         idempotency_key=False):
+        """Send ZNS message using BOM API
+        
+        The HTTP call is made inline; business flows should use
+        enqueue_zns_message instead so they never wait on the API.
+        
+        :param template_id: ID of the bom.zns.template to use
+        :param phone: Phone number of the recipient
+        :param params: Dictionary of parameters to use in the template
+        :param partner_id: Optional partner ID for tracking
+        :param model: Optional model name for reference
+        :param res_id: Optional record ID for reference
+        :param is_test: Whether this is a test message
+        :param idempotency_key: Optional key identifying the message, see
+                                _make_idempotency_key; a message whose key is
+                                already recorded is not sent again
+        :return: Dictionary with status and message information
+        """
+        template, config, error = self._resolve_template(template_id)
+        if error:
+            return {'success': False, 'error': error}
+        
+        history_vals = self._prepare_history_vals(
+            template, config, phone, params=params, partner_id=partner_id,
+            model=model, res_id=res_id, is_test=is_test)
+        history_vals['idempotency_key'] = idempotency_key
+        
+        history, duplicates = self._create_histories([history_vals])
+        if duplicates:
+            return {'success': True, 'duplicate': True, 'history_id': duplicates[0].id}
+        return self._send_history(history)
+    
+    @api.model
+    def enqueue_zns_message(self, template_id, phone, params=None, partner_id=False, model=False, res_id=False, is_test=False,
+                            idempotency_key=False):
+        """Queue a ZNS message to be sent by the dispatcher
+        
+        Takes the same arguments as send_zns_message. The history record is
+        created in the 'queued' state and no HTTP call is made, so the
+        message only leaves once the caller's transaction is committed.
+        
+        :return: Dictionary with status and history information
+        """
+        template, config, error = self._resolve_template(template_id)
+        if error:
+            return {'success': False, 'error': error}
+        
+        history_vals = self._prepare_history_vals(
+            template, config, phone, params=params, partner_id=partner_id,
+            model=model, res_id=res_id, is_test=is_test)
+        
+        history_vals['state'] = 'queued'
+        history_vals['idempotency_key'] = idempotency_key
+        history, duplicates = self._create_histories([history_vals])
+        if duplicates:
+            return {'success': True, 'duplicate': True, 'history_id': duplicates[0].id}
+        self._trigger_dispatcher(history)
+        
+        return {
+            'success': True,
+            'queued': True,
+            'history_id': history.id,
         }
+    
+    def _trigger_dispatcher(self, histories):
+        """Get queued messages sent once the current transaction commits
+        
+        The messages are sent right after commit by the background
+        dispatcher thread, so the business transaction never waits on the
+        BOM API and a rollback cancels them; the periodic run of the
+        dispatcher cron picks up whatever the thread could not send. In cron
+        dispatch mode, the dispatcher cron is triggered instead.
+        
+        :param histories: bom.zns.history records just queued
+        """
+        settings = self.env['bom.zns.config']._get_company_settings(self.env.company.id)
+        if settings['dispatch_mode'] != 'postcommit':
+            data = self.env.cr.precommit.data
+            if not data.get('bom_zns.dispatch_triggered'):
+                cron = self.env.ref('bom_zns_simple.ir_cron_bom_zns_dispatch', raise_if_not_found=False)
+                if cron:
+                    data['bom_zns.dispatch_triggered'] = True
+                    self.env.cr.precommit.add(cron.sudo()._trigger)
+            return
+        
+        postcommit = self.env.cr.postcommit
+        history_ids = postcommit.data.setdefault('bom_zns.dispatch_ids', [])
+        if not history_ids:
+            postcommit.add(self._dispatch_after_commit)
+        history_ids.extend(histories.ids)
+    
+    def _dispatch_after_commit(self):
+        history_ids = self.env.cr.postcommit.data.pop('bom_zns.dispatch_ids', [])
+        if not history_ids or getattr(threading.current_thread(), 'testing', False):
+            return
+        _queue_background_dispatch(self.env.cr.dbname, dict(self.env.context), history_ids)
+    
+    @api.model
+    def _make_idempotency_key(self, template, model, res_id, purpose):
+        """Build the deterministic key identifying a business message
+        
+        The same template sent for the same purpose about the same document
+        always gets the same key, whichever worker or retry computes it.
         
-        history = self.env['bom.zns.history'].create(history_vals)
+        :param template: bom.zns.template record or ID
+        :param purpose: Short string telling why the message is sent
+        """
+        template_id = template.id if isinstance(template, models.BaseModel) else template
+        dbuuid = self.env['ir.config_parameter'].sudo().get_param('database.uuid', '')
+        return hashlib.sha1(f"{dbuuid}:{template_id}:{model}:{res_id}:{purpose}".encode()).hexdigest()
+    
+    def _create_histories(self, vals_list):
+        """Create history records, skipping the messages already recorded
+        
+        Idempotency keys are checked with a single lookup on their unique
+        index, then in the archive for the keys not found. If another
+        transaction records one of the keys meanwhile, the records are
+        created one by one and the conflicting ones are skipped.
+        
+        :return: Tuple (created records, dictionary mapping the index in
+                 vals_list of each skipped message to its existing record,
+                 empty for archived messages)
+        """
+        History = self.env['bom.zns.history']
+        keys = [vals.get('idempotency_key') or False for vals in vals_list]
+        if not any(keys):
+            return History.create(vals_list), {}
+        
+        existing = {
+            history.idempotency_key: history
+            for history in History.search([('idempotency_key', 'in', [key for key in keys if key])])
+        }
+        missing = [key for key in keys if key and key not in existing]
+        if missing:
+            archived = self.env['bom.zns.history.archive'].sudo().search([('idempotency_key', 'in', missing)])
+            existing.update((key, History) for key in archived.mapped('idempotency_key'))
+        duplicates = {}
+        to_create = []
+        seen = set()
+        for index, (vals, key) in enumerate(zip(vals_list, keys)):
+            if key and (key in existing or key in seen):
+                duplicates[index] = existing.get(key, History)
+                continue
+            if key:
+                seen.add(key)
+            to_create.append((index, vals))
         
         try:
+            with tools.mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+                histories = History.create([vals for index, vals in to_create])
+        except IntegrityError:
+            histories = History
+            for index, vals in to_create:
+                try:
+                    with tools.mute_logger('odoo.sql_db'), self.env.cr.savepoint():
+                        histories |= History.create(vals)
+                except IntegrityError:
+                    duplicates[index] = History
+        
+        # Messages repeated within vals_list point to the record just created
+        created = {history.idempotency_key: history for history in histories if history.idempotency_key}
+        for index, duplicate in duplicates.items():
+            if not duplicate:
+                duplicates[index] = created.get(keys[index], History)
+        return histories, duplicates
+    
+    def _create_histories_batch(self, messages, is_test=False, state='draft', idempotency_keys=None):
+        """Create the history records of many messages with a single create
+        
+        :param messages: List of (template, phone, params, partner, model, res_id)
+                         tuples; template and partner may be records or IDs
+        :param idempotency_keys: Optional list with the idempotency key of
+                                 each message, or False
+        :return: Tuple (results, positions, histories) where results holds
+                 the outcome of each rejected or duplicate message and None
+                 elsewhere, and positions gives the index in messages of
+                 each history
+        """
+        results = [None] * len(messages)
+        resolved = {}
+        vals_list = []
+        positions = []
+        for index, (template, phone, params, partner, model, res_id) in enumerate(messages):
+            template_id = template.id if isinstance(template, models.BaseModel) else template
+            if template_id not in resolved:
+                resolved[template_id] = self._resolve_template(template_id)
+            template, config, error = resolved[template_id]
+            if error:
+                results[index] = {'success': False, 'error': error}
+                continue
+            partner_id = partner.id if isinstance(partner, models.BaseModel) else partner
+            vals = self._prepare_history_vals(
+                template, config, phone, params=params, partner_id=partner_id or False,
+                model=model, res_id=res_id, is_test=is_test)
+            vals['state'] = state
+            if idempotency_keys:
+                vals['idempotency_key'] = idempotency_keys[index]
+            vals_list.append(vals)
+            positions.append(index)
+        
+        histories, duplicates = self._create_histories(vals_list)
+        for vals_index, duplicate in duplicates.items():
+            results[positions[vals_index]] = {
+                'success': True,
+                'duplicate': True,
+                'history_id': duplicate.id,
+            }
+        positions = [position for vals_index, position in enumerate(positions) if vals_index not in duplicates]
+        return results, positions, histories
+    
+    @api.model
+    def send_zns_messages_batch(self, messages, is_test=False, idempotency_keys=None):
+        """Send many ZNS messages at once
+        
+        History records are created with a single multi-record create, then
+        the HTTP calls are made concurrently by a bounded worker pool.
+        
+        :param messages: List of (template, phone, params, partner, model, res_id)
+                         tuples; template and partner may be records or IDs
+        :param is_test: Whether these are test messages
+        :param idempotency_keys: Optional list with the idempotency key of
+                                 each message; duplicates are not sent
+        :return: List of result dictionaries, in the order of messages
+        """
+        results, positions, histories = self._create_histories_batch(
+            messages, is_test=is_test, idempotency_keys=idempotency_keys)
+        for index, result in zip(positions, self._dispatch_messages(histories)):
+            results[index] = result
+        return results
+    
+    @api.model
+    def enqueue_zns_messages_batch(self, messages, is_test=False, idempotency_keys=None):
+        """Queue many ZNS messages for the dispatcher with a single create
+        
+        Takes the same arguments as send_zns_messages_batch.
+        
+        :return: List of result dictionaries, in the order of messages
+        """
+        results, positions, histories = self._create_histories_batch(
+            messages, is_test=is_test, state='queued', idempotency_keys=idempotency_keys)
+        for index, history in zip(positions, histories):
+            results[index] = {
+                'success': True,
+                'queued': True,
+                'history_id': history.id,
+            }
+        if histories:
+            self._trigger_dispatcher(histories)
+        return results
+    
+    @api.model
+    def _enqueue_auto_send(self, records, template_key):
+        """Queue the automatic message of a business flow for many records
+        
+        Records already notified, without an opted-in partner or without a
+        phone number are skipped. Each message carries an idempotency key
+        built from the template, the record and the business flow, so a
+        record is never notified twice even by concurrent transactions.
+        
+        :param records: Records of sale.order, account.move or crm.lead
+        :param template_key: Setting holding the template ID, e.g. 'so_template_id'
+        """
+        settings = self.env['bom.zns.config']._get_company_settings(self.env.company.id)
+        template_id = settings[template_key]
+        if not template_id:
+            return
+        
+        template = self.env['bom.zns.template'].browse(template_id).exists()
+        if not template:
+            return
+        
+        # Get phone numbers
+        phones = {}
+        for record in records.filtered(lambda r: not r.zns_sent and r.partner_id.zalo_opt_in):
+            phone = record.partner_id.zalo_phone or record.partner_id.mobile or record.partner_id.phone
+            if phone:
+                phones[record.id] = phone
+        if not phones:
+            return
+        
+        records = self._claim_auto_send(records.browse(list(phones)))
+        if not records:
+            return
+        
+        # Prepare parameters
+        params = template._render_params_batch(records)
+        
+        results = self.enqueue_zns_messages_batch([
+            (template, phones[record.id], params[record.id], record.partner_id, record._name, record.id)
+            for record in records
+        ], idempotency_keys=[
+            self._make_idempotency_key(template, record._name, record.id, template_key)
+            for record in records
+        ])
+        failed = [record.id for record, result in zip(records, results) if not result.get('success')]
+        if failed:
+            records.browse(failed).write({'zns_sent': False})
+    
+    @api.model
+    def _claim_auto_send(self, records):
+        """Flag records as notified unless another transaction already did
+        
+        The check and the update are a single statement, so two transactions
+        can never both claim the same record.
+        
+        :return: The records claimed by this transaction
+        """
+        records.flush(['zns_sent'])
+        self.env.cr.execute(f"""
+            UPDATE "{records._table}" SET zns_sent = TRUE
+             WHERE id IN %s AND zns_sent IS NOT TRUE
+         RETURNING id
+        """, (tuple(records.ids),))
+        claimed = {row[0] for row in self.env.cr.fetchall()}
+        records.invalidate_cache(['zns_sent'], list(claimed))
+        return records.filtered(lambda record: record.id in claimed)
+    
+    @api.model
+    def _schedule_auto_send(self, records, template_key):
+        """Queue the automatic message of many records at the end of the transaction
+        
+        Records of every call made during the transaction are collected and
+        queued together by a single batch just before commit.
+        """
+        if not records:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.setdefault('bom_zns.auto_send', {})
+        if not pending:
+            self.env.cr.precommit.add(self._flush_auto_send)
+        pending.setdefault((records._name, template_key), set()).update(records.ids)
+    
+    def _flush_auto_send(self):
+        pending = self.env.cr.precommit.data.pop('bom_zns.auto_send', {})
+        for (model_name, template_key), ids in pending.items():
+            records = self.env[model_name].browse(sorted(ids)).exists()
+            # The transaction may have undone what triggered the message since,
+            # e.g. a rolled back savepoint or a lead moved out of a won stage
+            records.invalidate_cache()
+            self._enqueue_auto_send(records._filter_zns_auto_send(), template_key)
+        self.flush()
+    
+    def _send_history(self, history):
+        """Send the request stored on a history record and record the outcome
+        
+        :param history: bom.zns.history record in 'draft' or 'queued' state
+        :return: Dictionary with status and message information
+        """
+        return self._dispatch_messages(history)[0]
+    
+    def _get_send_workers(self):
+        return self.env['bom.zns.config']._get_company_settings(self.env.company.id)['send_workers']
+    
+    def _group_by_config(self, histories):
+        """Group history records by the configuration used to call BOM
+        
+        Records whose configuration was deleted fall back to the active
+        configuration of their company. This never raises, so one such record
+        cannot block a whole batch.
+        
+        :return: Tuple (dictionary mapping configurations to lists of
+                 records, records without any configuration)
+        """
+        Config = self.env['bom.zns.config']
+        by_config = defaultdict(list)
+        unconfigured = self.env['bom.zns.history']
+        for history in histories:
+            config = history.config_id or Config.browse(
+                Config._get_company_config_id(history.company_id.id or self.env.company.id))
+            if config:
+                by_config[config].append(history)
+            else:
+                unconfigured |= history
+        return by_config, unconfigured
+    
+    def _apply_rate_limits(self, by_config):
+        """Split batches of history records along the rate limits of their configuration
+        
+        :param by_config: Dictionary mapping configurations to lists of records
+        :return: Tuple (list of (history, config) allowed to be sent now,
+                 records to keep queued, seconds until they can be sent)
+        """
+        RateLimit = self.env['bom.zns.rate.limit']
+        allowed = []
+        throttled = self.env['bom.zns.history']
+        wait = 0
+        for config, config_histories in by_config.items():
+            granted, delay = RateLimit._acquire(config, len(config_histories))
+            allowed.extend((history, config) for history in config_histories[:granted])
+            for history in config_histories[granted:]:
+                throttled |= history
+            wait = max(wait, delay)
+        return allowed, throttled, wait
+    
+    def _throttle_messages(self, histories, wait):
+        """Keep messages over the rate limit queued and wake the dispatcher when they can go
+        
+        The messages are not claimed again before then, so the dispatcher
+        moves on to the messages of other configurations meanwhile.
+        """
+        not_before = fields.Datetime.now() + timedelta(seconds=wait)
+        histories.write({'state': 'queued', 'next_retry_at': not_before})
+        cron = self.env.ref('bom_zns_simple.ir_cron_bom_zns_dispatch', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(not_before)
+        _logger.info(f"ZNS rate limit reached, {len(histories)} message(s) postponed by {int(wait)}s")
+    
+    def _dispatch_messages(self, histories):
+        """Send a batch of history records
+        
+        Only the HTTP calls run in worker threads; requests are prepared and
+        responses are written back to the history from the calling thread.
+        Messages over the rate limit of their configuration stay queued for
+        the dispatcher and get a 'throttled' result.
+        
+        :return: List of result dictionaries, in the order of histories
+        """
+        by_config, unconfigured = self._group_by_config(histories)
+        results = {}
+        if unconfigured:
+            error_message = _("BOM ZNS Configuration not found for this company. Please set it up first.")
+            unconfigured._handle_send_failure(error_message)
+            for history in unconfigured:
+                results[history.id] = {
+                    'success': False,
+                    'error': error_message,
+                    'history_id': history.id,
+                }
+        
+        allowed, throttled, wait = self._apply_rate_limits(by_config)
+        if throttled:
+            self._throttle_messages(throttled, wait)
+            for history in throttled:
+                results[history.id] = {
+                    'success': True,
+                    'queued': True,
+                    'throttled': True,
+                    'history_id': history.id,
+                }
+        
+        jobs = []
+        for history, config in allowed:
+            request_data = history._get_request_data()
+            
             # Log request if debug mode is enabled
             if config.debug_mode:
                 _logger.info(f"Sending ZNS request: {json.dumps(request_data)}")
             
-            # Send request to BOM API
-            response = requests.post(
-                f"{config.base_url}/send-template",
-                headers=headers,
-                json=request_data,
-                timeout=30
-            )
+            # Lets BOM drop a message it already accepted, e.g. after a timeout
+            headers = {'X-Idempotency-Key': history.idempotency_key} if history.idempotency_key else None
+            jobs.append((history, config, request_data, config._get_session(),
+                         f"{config.base_url}/send-template", headers))
+        
+        if len(jobs) > 1:
+            workers = min(self._get_send_workers(), len(jobs))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(
+                    lambda job: _call_api(job[3], 'post', job[4], job[2], headers=job[5]), jobs))
+        else:
+            responses = [_call_api(job[3], 'post', job[4], job[2], headers=job[5]) for job in jobs]
+        
+        failure_groups = defaultdict(list)
+        drained = set()
+        for (history, config, request_data, session, url, headers), (status_code, text, exc) in zip(jobs, responses):
+            # BOM refused the request for quota, stop the other workers too
+            if status_code == 429 and config not in drained:
+                self.env['bom.zns.rate.limit']._drain(config)
+                drained.add(config)
             
-            # Always store the response
-            history.write({'bom_response': response.text})
+            if exc is None:
+                try:
+                    response_data = json.loads(text)
+                except Exception as e:
+                    exc = e
             
-            # Process response
-            response_data = response.json()
+            if exc is not None:
+                # Handle exception
+                error_message = f"Error sending ZNS message: {str(exc)}"
+                _logger.error(error_message)
+                if text is not None:
+                    history.write(history._get_response_vals(text))
+                failure_groups[(error_message, _is_retryable(status_code))].append(history.id)
+                results[history.id] = {
+                    'success': False,
+                    'error': error_message,
+                    'history_id': history.id,
+                    'debug_info': history.debug_information,
+                    'request_data': json.dumps(request_data),
+                }
+                continue
             
             # Log response if debug mode is enabled
             if config.debug_mode:
-                _logger.info(f"ZNS Response: {response.text}")
+                _logger.info(f"ZNS Response: {text}")
             
-            if response.status_code == 200 and response_data.get('status') == 'success':
+            if status_code == 200 and response_data.get('status') == 'success':
                 # Update history record
-                history.write({
-                    'message_id': response_data.get('message_id', 'Unknown'),
+                history.write(dict(history._get_response_vals(text), **{
+                    'message_id': response_data.get('message_id') or False,
                     'state': 'sent',
                     'message_content': response_data.get('content', ''),
-                })
+                    'error_message': False,
+                    'next_retry_at': False,
+                }))
                 
-                return {
+                results[history.id] = {
                     'success': True,
                     'message_id': response_data.get('message_id'),
-                    'response': response.text,
+                    'response': text,
                     'history_id': history.id,
                     'request_data': json.dumps(request_data),
                 }
             else:
                 # Handle error
                 error_message = response_data.get('message', 'Unknown error')
-                history.action_mark_as_failed(error_message)
+                history.write(history._get_response_vals(text))
+                failure_groups[(error_message, _is_retryable(status_code))].append(history.id)
                 
-                return {
+                results[history.id] = {
                     'success': False,
                     'error': error_message,
-                    'response': response.text,
+                    'response': text,
                     'history_id': history.id,
-                    'debug_info': json.dumps(debug_info),
+                    'debug_info': history.debug_information,
                     'request_data': json.dumps(request_data),
                 }
-                
-        except Exception as e:
-            # Handle exception
-            error_message = f"Error sending ZNS message: {str(e)}"
-            _logger.exception(error_message)
-            
-            # Update history record
-            history.action_mark_as_failed(error_message)
-            
-            return {
-                'success': False,
-                'error': error_message,
-                'history_id': history.id,
-                'debug_info': json.dumps(debug_info),
-                'request_data': json.dumps(request_data),
-            }
+        
+        # Failed messages are retried or marked as failed together, one
+        # write per error
+        History = self.env['bom.zns.history']
+        for (error_message, retryable), history_ids in failure_groups.items():
+            History.browse(history_ids)._handle_send_failure(error_message, retryable=retryable)
+        
+        return [results[history.id] for history in histories]
+    
+    def _claim_queued_messages(self, limit, history_ids=None):
+        """Lock a batch of queued messages for this worker
+        
+        Rows already locked by another dispatcher are skipped, so several
+        cron workers can drain the queue in parallel. Messages waiting for
+        an automatic retry are only claimed once it is due.
+        
+        :param history_ids: Only claim among these history IDs
+        """
+        self.env['bom.zns.history'].flush(['state', 'next_retry_at'])
+        id_filter = "AND id IN %(ids)s" if history_ids else ""
+        self.env.cr.execute(f"""
+            SELECT id FROM bom_zns_history
+             WHERE state = 'queued' {id_filter}
+               AND (next_retry_at IS NULL OR next_retry_at <= now() at time zone 'UTC')
+          ORDER BY id
+             LIMIT %(limit)s
+               FOR UPDATE SKIP LOCKED
+        """, {'limit': limit, 'ids': tuple(history_ids or ())})
+        ids = [row[0] for row in self.env.cr.fetchall()]
+        return self.env['bom.zns.history'].browse(ids)
+    
+    @api.model
+    def cron_dispatch_queued_messages(self, batch_size=None):
+        """Scheduled action to send queued messages in batches"""
+        if not batch_size:
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            batch_size = int(IrConfig.get_param('bom_zns_simple.dispatch_batch_size', '100'))
+        
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        while True:
+            histories = self._claim_queued_messages(batch_size)
+            if not histories:
+                break
+            # Throttled messages are postponed, so the next claims move on
+            self._dispatch_messages(histories)
+            if not auto_commit:
+                break
+            # Release the row locks and make the batch visible
+            self.env.cr.commit()
+        
+        return True
     
+    @api.model
     def check_message_status(self, message_id):
-        """Check the status of a sent message
+        """Check the status of sent messages
         
-        :param message_id: Message ID from BOM API
-        :return: Dictionary with status information
+        :param message_id: Message ID from BOM API, or a list of message IDs
+        :return: Dictionary with status information, or a dictionary of
+                 them keyed by message ID when a list was given
         """
+        History = self.env['bom.zns.history']
+        if isinstance(message_id, (list, tuple)):
+            histories = History.search([('message_id', 'in', list(message_id))])
+            results = self._check_histories_status(histories)
+            return {history.message_id: results[history.id] for history in histories}
+        
         # Get history record
-        history = self.env['bom.zns.history'].search([('message_id', '=', message_id)], limit=1)
+        history = History.search([('message_id', '=', message_id)], limit=1)
         if not history:
             return {'success': False, 'error': _("Message not found in history.")}
         
-        # Get configuration
-        config = history.config_id or self.env['bom.zns.config'].get_bom_zns_config()
-        if not config:
-            return {'success': False, 'error': _("ZNS Configuration not found.")}
+        return self._check_histories_status(history)[history.id]
+    
+    def _get_status_workers(self):
+        return self.env['bom.zns.config']._get_company_settings(self.env.company.id)['status_workers']
+    
+    def _prepare_status_jobs(self, histories):
+        """Group status checks into API calls
         
-        try:
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Api-Key': config.api_key,
-                'X-Api-Secret': config.api_secret,
+        Configurations with a bulk status endpoint get one POST per chunk of
+        message IDs, the others one GET per message.
+        
+        :return: Tuple (list of (config, session, method, url, payload,
+                 histories), records without any configuration)
+        """
+        by_config, unconfigured = self._group_by_config(histories)
+        
+        History = self.env['bom.zns.history']
+        jobs = []
+        for config, config_histories in by_config.items():
+            history_ids = [history.id for history in config_histories]
+            session = config._get_session()
+            if config.bulk_status:
+                size = max(config.bulk_status_size or 1, 1)
+                for start in range(0, len(history_ids), size):
+                    chunk = History.browse(history_ids[start:start + size])
+                    jobs.append((config, session, 'post', f"{config.base_url}/status/bulk",
+                                 {'message_ids': chunk.mapped('message_id')}, chunk))
+            else:
+                for history in History.browse(history_ids):
+                    jobs.append((config, session, 'get', f"{config.base_url}/status/{history.message_id}",
+                                 None, history))
+        return jobs, unconfigured
+    
+    def _check_histories_status(self, histories):
+        """Poll the BOM API for the status of many sent messages
+        
+        Status calls run concurrently in a bounded worker pool, and the
+        results are applied with one write per target state. Messages that
+        are still pending get their next check pushed back.
+        
+        :return: Dictionary mapping history IDs to status information
+        """
+        jobs, unconfigured = self._prepare_status_jobs(histories.filtered('message_id'))
+        
+        if len(jobs) > 1:
+            workers = min(self._get_status_workers(), len(jobs))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(
+                    lambda job: _call_api(job[1], job[2], job[3], job[4]), jobs))
+        else:
+            responses = [_call_api(job[1], job[2], job[3], job[4]) for job in jobs]
+        
+        History = self.env['bom.zns.history']
+        results = {}
+        updates = {}
+        errors = unconfigured
+        for history in unconfigured:
+            results[history.id] = {
+                'success': False,
+                'error': _("BOM ZNS Configuration not found for this company. Please set it up first."),
+                'history_id': history.id,
             }
+        for (config, session, method, url, payload, job_histories), (status_code, text, exc) in zip(jobs, responses):
+            if exc is None:
+                try:
+                    response_data = json.loads(text)
+                except Exception as e:
+                    exc = e
             
-            # Send request to BOM API
-            response = requests.get(
-                f"{config.base_url}/status/{message_id}",
-                headers=headers,
-                timeout=30
-            )
-            
-            # Process response
-            response_data = response.json()
+            if exc is not None or status_code != 200:
+                # Handle error
+                if exc is not None:
+                    error_message = f"Error checking message status: {str(exc)}"
+                    _logger.error(error_message)
+                else:
+                    error_message = response_data.get('message', 'Unknown error')
+                for history in job_histories:
+                    results[history.id] = {
+                        'success': False,
+                        'error': error_message,
+                        'response': text,
+                        'history_id': history.id,
+                    }
+                errors |= job_histories
+                continue
             
             # Log response if debug mode is enabled
             if config.debug_mode:
-                _logger.info(f"Status Check Response: {response.text}")
+                _logger.info(f"Status Check Response: {text}")
             
-            if response.status_code == 200:
-                # Update history record based on status
-                status = response_data.get('status', 'unknown')
-                history_vals = {'bom_response': response.text}
-                
-                if status == 'delivered':
-                    history_vals.update({
-                        'state': 'delivered',
-                        'delivery_date': fields.Datetime.now(),
-                    })
-                elif status == 'read':
-                    history_vals.update({
-                        'state': 'read',
-                        'delivery_date': history.delivery_date or fields.Datetime.now(),
-                        'read_date': fields.Datetime.now(),
-                    })
-                elif status == 'failed':
-                    history_vals.update({
-                        'state': 'failed',
-                        'error_message': response_data.get('message', 'Failed to deliver message'),
-                    })
+            if payload is None:
+                statuses = {job_histories.message_id: response_data}
+            else:
+                statuses = {item.get('message_id'): item for item in response_data.get('data') or []}
+            
+            for history in job_histories:
+                item = statuses.get(history.message_id) or {}
                 
-                history.write(history_vals)
+                # Update history record based on status
+                status = item.get('status', 'unknown')
+                updates[history.id] = (status, item.get('message'))
                 
-                return {
+                results[history.id] = {
                     'success': True,
                     'status': status,
-                    'response': response.text,
+                    'response': text if payload is None else json.dumps(item),
                     'history_id': history.id,
                 }
-            else:
-                # Handle error
-                error_message = response_data.get('message', 'Unknown error')
-                
-                return {
-                    'success': False,
-                    'error': error_message,
-                    'response': response.text,
-                    'history_id': history.id,
-                }
-                
-        except Exception as e:
-            # Handle exception
-            error_message = f"Error checking message status: {str(e)}"
-            _logger.exception(error_message)
-            
-            return {
+        
+        pending = History.browse(list(updates))._apply_status_updates(updates)
+        
+        # Back off harder when the API could not answer
+        pending._schedule_next_check()
+        errors._schedule_next_check(factor=2)
+        
+        for history in histories - histories.filtered('message_id'):
+            results[history.id] = {
                 'success': False,
-                'error': error_message,
+                'error': _("Message has no message ID."),
                 'history_id': history.id,
             }
+        return results
     
     @api.model
-    def cron_check_pending_messages(self):
+    def cron_check_pending_messages(self, batch_size=None):
         """Scheduled action to check status of pending messages"""
-        # Get messages that are in 'sent' state and were sent less than 24 hours ago
-        pending_messages = self.env['bom.zns.history'].search([
-            ('state', '=', 'sent'),
-            ('create_date', '>=', fields.Datetime.now() - datetime.timedelta(days=1)),
-        ], limit=100)
+        if not batch_size:
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            batch_size = int(IrConfig.get_param('bom_zns_simple.status_batch_size', '500'))
         
-        for message in pending_messages:
-            if message.message_id:
-                self.check_message_status(message.message_id)
+        History = self.env['bom.zns.history']
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        
+        # Walk all messages that are in 'sent' state, were sent less than
+        # 24 hours ago and whose backoff delay has elapsed
+        now = fields.Datetime.now()
+        domain = [
+            ('state', '=', 'sent'),
+            ('message_id', '!=', False),
+            ('create_date', '>=', now - timedelta(days=1)),
+            '|', ('next_check_date', '=', False), ('next_check_date', '<=', now),
+        ]
+        last_id = 0
+        while True:
+            pending_messages = History.search(domain + [('id', '>', last_id)], order='id', limit=batch_size)
+            if not pending_messages:
+                break
+            last_id = pending_messages[-1].id
+            self._check_histories_status(pending_messages)
+            if auto_commit:
+                self.env.cr.commit()
         
         return True
+    
     def refresh_oa_info(self):
         """Refresh OA information by calling the config's sync method"""
         self.ensure_one()
-        config = self.env['bom.zns.config'].search([
-            ('company_id', '=', self.env.company.id),
-            ('active', '=', True)
-        ], limit=1)
+        Config = self.env['bom.zns.config']
+        config = Config.browse(Config._get_company_config_id(self.env.company.id))
         if config:
             return config.sync_zalo_oa_info()
         return {
@@ -1,11 +1,20 @@
 import logging
+import threading
 import requests
 import json
-from odoo import api, fields, models, _
+from requests.adapters import HTTPAdapter
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError
 
 _logger = logging.getLogger(__name__)
 
+# Process-wide HTTP sessions, keyed by database, config and credentials
+_SESSIONS = {}
+_SESSIONS_LOCK = threading.Lock()
+
+# Fields whose change makes the cached session unusable
+SESSION_FIELDS = ('api_key', 'api_secret', 'base_url', 'pool_size', 'keep_alive')
+
 class BomZnsConfig(models.Model):
     _name = 'bom.zns.config'
     _description = 'BOM ZNS Configuration'
@@ -25,25 +34,114 @@ class BomZnsConfig(models.Model):
     zalo_oa_name = fields.Char('Zalo OA Name', help='Zalo Official Account Name')
     last_sync_date = fields.Datetime('Last Sync Date', help='Last time OA information was synced')
     
+    # Connection settings
+    pool_size = fields.Integer('Connection Pool Size', default=10,
+                               help='Maximum number of connections kept open to the BOM API by each Odoo worker')
+    keep_alive = fields.Boolean('Keep-Alive', default=True,
+                                help='Reuse connections to the BOM API between requests')
+    bulk_status = fields.Boolean('Bulk Status Endpoint', default=False,
+                                 help='The BOM API accepts many message IDs in a single status request')
+    bulk_status_size = fields.Integer('Bulk Status Size', default=100,
+                                      help='Maximum number of message IDs per bulk status request')
+    
+    # Rate limiting
+    rate_limit = fields.Float('Rate Limit', default=0.0,
+                              help='Maximum number of messages sent per second, shared by all Odoo workers. 0 means unlimited.')
+    rate_burst = fields.Integer('Burst Size', default=10,
+                                help='Maximum number of messages sent at once after an idle period')
+    daily_cap = fields.Integer('Daily Cap', default=0,
+                               help='Maximum number of messages sent per day (UTC). 0 means unlimited.')
+    
+    # History settings
+    payload_storage = fields.Selection([
+        ('full', 'Full'),
+        ('compact', 'Compact'),
+    ], string='Payload Storage', default='full', required=True,
+       help='Full: the request, the response and debug information are stored as sent and received.\n'
+            'Compact: the request is rebuilt from the message parameters, large responses are compressed '
+            'and debug information is only stored in debug mode.')
+    history_logging = fields.Selection([
+        ('full', 'Full (Chatter Tracking)'),
+        ('lean', 'Lean (Event Log)'),
+    ], string='History Logging', default='full', required=True,
+       help='Full: message history is tracked in the chatter.\n'
+            'Lean: no chatter tracking, status changes are stored in a compact event log.')
+    
     _sql_constraints = [
         ('unique_company_config', 'unique(company_id)', 'Only one configuration per company is allowed.')
     ]
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        configs = super(BomZnsConfig, self).create(vals_list)
+        self.clear_caches()
+        return configs
+    
+    def write(self, vals):
+        if any(field in vals for field in SESSION_FIELDS):
+            self._invalidate_sessions()
+        result = super(BomZnsConfig, self).write(vals)
+        if 'company_id' in vals or 'active' in vals:
+            self.clear_caches()
+        return result
+    
+    def unlink(self):
+        self._invalidate_sessions()
+        self.env['bom.zns.stats.daily'].sudo()._release_key('config_id', self.ids)
+        result = super(BomZnsConfig, self).unlink()
+        self.clear_caches()
+        return result
+    
+    def _get_session_key(self):
+        self.ensure_one()
+        return (self.env.cr.dbname, self.id, self.api_key, self.api_secret,
+                self.base_url, self.pool_size, self.keep_alive)
+    
+    def _get_session(self):
+        """Get the pooled HTTP session for this configuration
+        
+        Sessions are shared by all requests of the process, so the TCP and
+        TLS handshake with the BOM API is only paid once per connection.
+        """
+        self.ensure_one()
+        key = self._get_session_key()
+        session = _SESSIONS.get(key)
+        if session:
+            return session
+        
+        with _SESSIONS_LOCK:
+            session = _SESSIONS.get(key)
+            if not session:
+                pool_size = max(self.pool_size or 1, 1)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'X-Api-Key': self.api_key or '',
+                    'X-Api-Secret': self.api_secret or '',
+                })
+                if not self.keep_alive:
+                    session.headers['Connection'] = 'close'
+                _SESSIONS[key] = session
+        return session
+    
+    def _invalidate_sessions(self):
+        """Close and forget the HTTP sessions of these configurations"""
+        dbname = self.env.cr.dbname
+        with _SESSIONS_LOCK:
+            for key in list(_SESSIONS):
+                if key[0] == dbname and key[1] in self.ids:
+                    _SESSIONS.pop(key).close()
+    
     def test_connection(self):
         """Test the connection to BOM ZNS API"""
         self.ensure_one()
         try:
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Api-Key': self.api_key,
-                'X-Api-Secret': self.api_secret,
-            }
-            
             # Make a simple request to test connection
-            response = requests.get(
-                f"{self.base_url}/status",
-                headers=headers
+            response = self._get_session().get(
+                f"{self.base_url}/status"
             )
             
             # Log the response if debug mode is enabled
@@ -94,18 +192,10 @@ class BomZnsConfig(models.Model):
         """Sync Zalo OA information from BOM ZNS API"""
         self.ensure_one()
         try:
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Api-Key': self.api_key,
-                'X-Api-Secret': self.api_secret,
-            }
-            
             # Make request to get OA information
             # Note: This is a placeholder endpoint - adjust according to actual BOM API
-            response = requests.get(
-                f"{self.base_url}/zalo-oa-info",
-                headers=headers
+            response = self._get_session().get(
+                f"{self.base_url}/zalo-oa-info"
             )
             
             # Log the response if debug mode is enabled
@@ -165,8 +255,49 @@ class BomZnsConfig(models.Model):
         if not company_id:
             company_id = self.env.company.id
         
-        config = self.search([('company_id', '=', company_id), ('active', '=', True)], limit=1)
+        config = self.browse(self._get_company_config_id(company_id))
         if not config:
             raise UserError(_("BOM ZNS Configuration not found for this company. Please set it up first."))
         
-        return config
\ No newline at end of file
+        return config
+    
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_company_config_id(self, company_id):
+        """Get the ID of the active configuration of a company, False if none
+        
+        Cached until a configuration is created, deleted, archived or moved
+        to another company.
+        """
+        return self.sudo().search([('company_id', '=', company_id), ('active', '=', True)], limit=1).id
+    
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_company_settings(self, company_id):
+        """Get a snapshot of the ZNS settings used when sending for a company
+        
+        Holds the system parameters read by the business hooks and when
+        calling the BOM API. Writing a system parameter clears the registry
+        caches, so the snapshot is rebuilt on the next call.
+        """
+        IrConfig = self.env['ir.config_parameter'].sudo()
+        
+        def get_bool(key):
+            return IrConfig.get_param(key, 'False').lower() == 'true'
+        
+        def get_int(key, default):
+            return int(IrConfig.get_param(key, default) or default)
+        
+        return tools.frozendict({
+            'safe_eval': get_bool('bom.zns.safe_eval'),
+            'auto_send_so': get_bool('bom_zns_simple.auto_send_so'),
+            'auto_send_invoice': get_bool('bom_zns_simple.auto_send_invoice'),
+            'auto_send_crm': get_bool('bom_zns_simple.auto_send_crm'),
+            'so_template_id': get_int('bom_zns_simple.so_template_id', '0'),
+            'invoice_template_id': get_int('bom_zns_simple.invoice_template_id', '0'),
+            'crm_template_id': get_int('bom_zns_simple.crm_template_id', '0'),
+            'dispatch_mode': IrConfig.get_param('bom_zns_simple.dispatch_mode', 'postcommit'),
+            'send_workers': max(get_int('bom_zns_simple.send_workers', '8'), 1),
+            'status_workers': max(get_int('bom_zns_simple.status_workers', '8'), 1),
+            'sync_workers': max(get_int('bom_zns_simple.sync_workers', '8'), 1),
+        })
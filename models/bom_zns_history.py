@@ -1,9 +1,15 @@
 import logging
+import base64
 import json
-from odoo import api, fields, models, _
+import zlib
+from collections import Counter
+from odoo import api, fields, models, tools, _
 
 _logger = logging.getLogger(__name__)
 
+# Fields the daily statistics of a message depend on
+STATS_FIELDS = {'state', 'delivery_date', 'company_id', 'config_id', 'template_id', 'template_type'}
+
 class BomZnsHistory(models.Model):
     _name = 'bom.zns.history'
     _description = 'BOM ZNS Message History'
@@ -13,10 +19,12 @@ class BomZnsHistory(models.Model):
     
     message_id = fields.Char('Message ID', readonly=True, track_visibility='onchange',
                             help='Unique message ID from BOM ZNS')
+    idempotency_key = fields.Char('Idempotency Key', readonly=True, copy=False,
+                                  help='Identifies the business message, which is never recorded or sent twice')
     
     # Relation fields
-    template_id = fields.Many2one('bom.zns.template', string='Template', ondelete='set null')
-    partner_id = fields.Many2one('res.partner', string='Recipient', ondelete='set null')
+    template_id = fields.Many2one('bom.zns.template', string='Template', ondelete='set null', index=True)
+    partner_id = fields.Many2one('res.partner', string='Recipient', ondelete='set null', index=True)
     company_id = fields.Many2one('res.company', string='Company', default=lambda self: self.env.company)
     config_id = fields.Many2one('bom.zns.config', string='ZNS Configuration')
     user_id = fields.Many2one('res.users', string='Sent By', default=lambda self: self.env.user,
@@ -40,6 +48,7 @@ class BomZnsHistory(models.Model):
     # Status tracking
     state = fields.Selection([
         ('draft', 'Draft'),
+        ('queued', 'Queued'),
         ('sent', 'Sent'),
         ('delivered', 'Delivered'),
         ('read', 'Read'),
@@ -52,11 +61,26 @@ class BomZnsHistory(models.Model):
     delivery_date = fields.Datetime('Delivery Date', readonly=True)
     read_date = fields.Datetime('Read Date', readonly=True)
     
+    # Status polling
+    check_count = fields.Integer('Status Checks', default=0, readonly=True,
+                                 help='Number of times the status was polled from BOM')
+    next_check_date = fields.Datetime('Next Status Check', readonly=True,
+                                      help='Earliest time the status will be polled again')
+    
+    # Automatic retries
+    retry_count = fields.Integer('Retries', default=0, readonly=True,
+                                 help='Number of automatic retries after a temporary sending error')
+    next_retry_at = fields.Datetime('Next Retry', readonly=True,
+                                    help='Earliest time the dispatcher sends the message again')
+    
     # Additional information
     is_test = fields.Boolean('Test Message', default=False, readonly=True,
                             help='Whether this was a test message')
     bom_response = fields.Text('BOM API Response', readonly=True,
                               help='Complete response from BOM API')
+    bom_response_zip = fields.Binary('Compressed BOM API Response', attachment=False, readonly=True,
+                                     help='Base64 of the zlib-compressed response, used for large '
+                                          'responses in compact payload storage')
     
     # Debugging information
     request_data = fields.Text('Request Data', readonly=True,
@@ -64,6 +88,355 @@ class BomZnsHistory(models.Model):
     debug_information = fields.Text('Debug Information', readonly=True,
                                    help='Additional debug information')
     
+    # Payloads as displayed, whatever the payload storage of the configuration
+    bom_response_display = fields.Text('BOM API Response', compute='_compute_payload_display')
+    request_data_display = fields.Text('Request Data', compute='_compute_payload_display')
+    
+    # Status log, used instead of chatter tracking in lean logging mode
+    event_ids = fields.One2many('bom.zns.history.event', 'history_id', string='Status Events')
+    
+    def init(self):
+        # Message IDs are looked up by the webhook, the status checks and the
+        # crons; the placeholder and duplicate IDs written by version 1.0 are
+        # cleared by its migration
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS bom_zns_history_message_id_uniq
+                ON bom_zns_history (message_id)
+             WHERE message_id IS NOT NULL
+        """)
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS bom_zns_history_idempotency_key_uniq
+                ON bom_zns_history (idempotency_key)
+             WHERE idempotency_key IS NOT NULL
+        """)
+        # Crons and dashboard filter on state and creation date
+        tools.create_index(self.env.cr, 'bom_zns_history_state_create_date_index',
+                           self._table, ['state', 'create_date'])
+        # Backs the keyset pagination of the customer portal
+        tools.create_index(self.env.cr, 'bom_zns_history_partner_create_date_index',
+                           self._table, ['partner_id', 'create_date DESC', 'id DESC'])
+        # Backs zns_history_ids on sale.order, account.move and crm.lead
+        tools.create_index(self.env.cr, 'bom_zns_history_model_res_id_index',
+                           self._table, ['model', 'res_id'])
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Skip chatter tracking for configurations in lean logging mode
+        and count new messages in the daily statistics"""
+        config_ids = {vals.get('config_id') for vals in vals_list if vals.get('config_id')}
+        lean_config_ids = set(self.env['bom.zns.config'].sudo().browse(config_ids).filtered(
+            lambda config: config.history_logging == 'lean').ids)
+        if not lean_config_ids:
+            records = super(BomZnsHistory, self).create(vals_list)
+        else:
+            is_lean = [vals.get('config_id') in lean_config_ids for vals in vals_list]
+            full_vals = [vals for vals, lean in zip(vals_list, is_lean) if not lean]
+            lean_vals = [vals for vals, lean in zip(vals_list, is_lean) if lean]
+            full = super(BomZnsHistory, self).create(full_vals) if full_vals else self.browse()
+            lean = super(BomZnsHistory, self.with_context(tracking_disable=True)).create(lean_vals)
+            lean._log_state_events()
+            
+            # Return the records in the order of vals_list
+            full_ids = iter(full.ids)
+            lean_ids = iter(lean.ids)
+            records = self.browse([next(lean_ids) if lean else next(full_ids) for lean in is_lean])
+        
+        Stats = self.env['bom.zns.stats.daily'].sudo()
+        Stats._record_changes([], Stats._get_history_counts(records))
+        self._add_partner_counts(Counter(history.partner_id.id for history in records))
+        return records
+    
+    def write(self, vals):
+        changed = self.filtered(lambda h: h.state != vals['state']) if 'state' in vals else self.browse()
+        Stats = self.env['bom.zns.stats.daily'].sudo()
+        counted = self if STATS_FIELDS.intersection(vals) else self.browse()
+        old_counts = Stats._get_history_counts(counted)
+        
+        partner_counts = Counter()
+        if 'partner_id' in vals:
+            for history in self:
+                partner_counts[history.partner_id.id] -= 1
+            partner_counts[vals['partner_id']] += len(self)
+        
+        lean = self.filtered(lambda h: h.config_id.history_logging == 'lean')
+        full = self - lean
+        if full:
+            super(BomZnsHistory, full).write(vals)
+        if lean:
+            super(BomZnsHistory, lean.with_context(tracking_disable=True)).write(vals)
+            (changed & lean)._log_state_events()
+        
+        if counted:
+            Stats._record_changes(old_counts, Stats._get_history_counts(counted))
+        self._add_partner_counts(partner_counts)
+        return True
+    
+    def unlink(self):
+        partner_counts = Counter()
+        for history in self:
+            partner_counts[history.partner_id.id] -= 1
+        # Archived messages keep being counted, rebuild_stats reads the archive too
+        if not self.env.context.get('bom_zns_archiving'):
+            Stats = self.env['bom.zns.stats.daily'].sudo()
+            Stats._record_changes(Stats._get_history_counts(self), [])
+        result = super(BomZnsHistory, self).unlink()
+        self._add_partner_counts(partner_counts)
+        return result
+    
+    @api.model
+    def _add_partner_counts(self, deltas):
+        """Change the stored message counters of partners at the end of the transaction
+        
+        Updating res_partner locks the partner rows until commit, so the
+        changes are collected and applied just before commit: transactions
+        sending for a long time, e.g. a large batch waiting on the BOM API,
+        do not hold the partner rows meanwhile. Until then, the counters of
+        the current transaction do not include its own messages.
+        
+        :param deltas: Dictionary mapping partner IDs to the number of
+                       messages to add, negative to remove
+        """
+        deltas = {partner_id: delta for partner_id, delta in deltas.items() if partner_id and delta}
+        if not deltas:
+            return
+        data = self.env.cr.precommit.data
+        pending = data.setdefault('bom_zns.partner_counts', Counter())
+        if not pending:
+            self.env.cr.precommit.add(self._flush_partner_counts)
+        pending.update(deltas)
+    
+    def _flush_partner_counts(self):
+        """Apply the collected partner counter changes with a single statement
+        
+        The counters are incremented in SQL so concurrent transactions never
+        lose an update.
+        """
+        pending = self.env.cr.precommit.data.pop('bom_zns.partner_counts', {})
+        deltas = sorted((partner_id, delta) for partner_id, delta in pending.items() if delta)
+        if not deltas:
+            return
+        self.env.cr.execute("""
+            UPDATE res_partner p
+               SET zns_history_count = COALESCE(p.zns_history_count, 0) + d.delta
+              FROM (VALUES {}) AS d(id, delta)
+             WHERE p.id = d.id
+        """.format(", ".join(["(%s, %s)"] * len(deltas))), [value for item in deltas for value in item])
+        self.env['res.partner'].invalidate_cache(['zns_history_count'], [partner_id for partner_id, delta in deltas])
+    
+    @api.model
+    @tools.ormcache('partner_id', 'count')
+    def _get_portal_archive_groups(self, partner_id, count):
+        """Get the monthly archive of the messages of a partner for the portal
+        
+        The message count of the partner is part of the cache key, so the
+        archive is only computed again when a message is added or removed.
+        
+        :param count: Stored message count of the partner
+        :return: Tuple of dictionaries with the month label, its date range
+                 and its message count, newest first
+        """
+        groups = self.sudo().read_group(
+            [('partner_id', '=', partner_id)], ['create_date'], ['create_date:month'],
+            orderby='create_date:month desc', lazy=False)
+        archive_groups = []
+        for group in groups:
+            date_begin, date_end = group['__range']['create_date:month'].values()
+            archive_groups.append({
+                'date_begin': date_begin,
+                'date_end': date_end,
+                'name': group['create_date:month'],
+                'item_count': group['__count'],
+            })
+        return tuple(archive_groups)
+    
+    def _log_state_events(self):
+        """Append the current state of these messages to the event log"""
+        if self:
+            self.env['bom.zns.history.event'].sudo().create([{
+                'history_id': history.id,
+                'state': history.state,
+                'error_message': history.error_message if history.state == 'failed' else False,
+            } for history in self])
+    
+    @api.depends('bom_response', 'bom_response_zip', 'request_data', 'template_code', 'phone', 'message_params')
+    def _compute_payload_display(self):
+        # bin_size would give the size of the compressed response instead of its content
+        compressed = {history.id: history.bom_response_zip
+                      for history in self.with_context(bin_size=False) if not history.bom_response}
+        for history in self:
+            response = history.bom_response
+            if not response and compressed.get(history.id):
+                try:
+                    response = zlib.decompress(base64.b64decode(compressed[history.id])).decode()
+                except Exception:
+                    response = False
+            history.bom_response_display = response
+            history.request_data_display = history.request_data or json.dumps(history._get_request_data())
+    
+    def _get_response_vals(self, text):
+        """Get the values storing a response of the BOM API on this message
+        
+        In compact payload storage, responses longer than the
+        bom_zns_simple.response_compress_threshold system parameter (in
+        characters, default 512) are stored compressed.
+        """
+        self.ensure_one()
+        if text and self.config_id.payload_storage == 'compact':
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            threshold = int(IrConfig.get_param('bom_zns_simple.response_compress_threshold', '512'))
+            if len(text) > threshold:
+                return {'bom_response': False,
+                        'bom_response_zip': base64.b64encode(zlib.compress(text.encode(), 9))}
+        return {'bom_response': text, 'bom_response_zip': False}
+    
+    def _get_request_data(self):
+        """Build the payload sent to the BOM API for this message"""
+        self.ensure_one()
+        try:
+            params = json.loads(self.message_params or '{}')
+        except Exception:
+            params = {}
+        return {
+            'template_id': self.template_code,
+            'phone': self.phone,
+            'params': params,
+        }
+    
+    def _apply_status_updates(self, updates):
+        """Apply delivery statuses reported by BOM
+        
+        Records are grouped so that there is one write per target state (and
+        per error message for failures). A status never moves a message
+        backwards, e.g. a late 'delivered' does not override 'read'.
+        
+        :param updates: Dictionary mapping history IDs to (status, message) tuples
+        :return: Records of self whose status is not final yet
+        """
+        delivered = []
+        read = []
+        read_undelivered = []
+        failed = {}
+        pending = self.browse()
+        for history in self:
+            status, message = updates.get(history.id, ('unknown', None))
+            if status == 'delivered':
+                if history.state not in ('delivered', 'read'):
+                    delivered.append(history.id)
+            elif status == 'read':
+                if history.state == 'read':
+                    continue
+                if history.delivery_date:
+                    read.append(history.id)
+                else:
+                    read_undelivered.append(history.id)
+            elif status == 'failed':
+                if history.state not in ('delivered', 'read'):
+                    failed.setdefault(message or 'Failed to deliver message', []).append(history.id)
+            else:
+                pending |= history
+        
+        now = fields.Datetime.now()
+        if delivered:
+            self.browse(delivered).write({'state': 'delivered', 'delivery_date': now})
+        if read:
+            self.browse(read).write({'state': 'read', 'read_date': now})
+        if read_undelivered:
+            self.browse(read_undelivered).write({
+                'state': 'read',
+                'delivery_date': now,
+                'read_date': now,
+            })
+        for error_message, history_ids in failed.items():
+            self.browse(history_ids).write({'state': 'failed', 'error_message': error_message})
+        return pending
+    
+    def _schedule_next_check(self, factor=1):
+        """Push back the next status poll with exponential backoff
+        
+        The delay doubles with every check and is at least a quarter of the
+        message age, so old messages are polled less and less often.
+        
+        :param factor: Multiplier applied to the delay, e.g. after an error
+        """
+        if not self:
+            return
+        IrConfig = self.env['ir.config_parameter'].sudo()
+        base = int(IrConfig.get_param('bom_zns_simple.status_backoff_base', '300'))
+        maximum = int(IrConfig.get_param('bom_zns_simple.status_backoff_max', '21600'))
+        self.flush(['check_count', 'next_check_date'])
+        self.env.cr.execute("""
+            UPDATE bom_zns_history
+               SET next_check_date = (now() at time zone 'UTC') + interval '1 second' * LEAST(
+                       %(factor)s * GREATEST(
+                           %(base)s * power(2, LEAST(COALESCE(check_count, 0), 20)),
+                           EXTRACT(EPOCH FROM (now() at time zone 'UTC') - create_date) / 4
+                       ),
+                       %(maximum)s
+                   ),
+                   check_count = COALESCE(check_count, 0) + 1
+             WHERE id IN %(ids)s
+        """, {'factor': factor, 'base': base, 'maximum': maximum, 'ids': tuple(self.ids)})
+        self.invalidate_cache(['check_count', 'next_check_date'], self.ids)
+    
+    def _handle_send_failure(self, error_message, retryable=False):
+        """Record a failed sending attempt
+        
+        Messages that failed for a temporary reason (no answer, rate limit,
+        server error) are queued again with an exponential, jittered delay
+        until bom_zns_simple.retry_max retries have been made. The others
+        are marked as failed.
+        
+        :param error_message: Error of the attempt
+        :param retryable: Whether the error is worth retrying
+        """
+        if not self:
+            return
+        to_retry = self.browse()
+        if retryable:
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            max_retries = int(IrConfig.get_param('bom_zns_simple.retry_max', '5'))
+            to_retry = self.filtered(lambda h: h.retry_count < max_retries and not h.is_test)
+        
+        (self - to_retry).write({
+            'state': 'failed',
+            'error_message': error_message,
+            'next_retry_at': False,
+        })
+        if to_retry:
+            to_retry.write({'state': 'queued', 'error_message': error_message})
+            to_retry._schedule_retry()
+    
+    def _schedule_retry(self):
+        """Set the next retry of these messages with exponential backoff and jitter
+        
+        The delay doubles with every retry up to bom_zns_simple.retry_backoff_max
+        and is spread over its upper half, so that messages failed together do
+        not all come back at once. The dispatcher cron is triggered for the
+        first of them.
+        """
+        if not self:
+            return
+        IrConfig = self.env['ir.config_parameter'].sudo()
+        base = int(IrConfig.get_param('bom_zns_simple.retry_backoff_base', '60'))
+        maximum = int(IrConfig.get_param('bom_zns_simple.retry_backoff_max', '3600'))
+        self.flush(['retry_count', 'next_retry_at'])
+        self.env.cr.execute("""
+            UPDATE bom_zns_history
+               SET next_retry_at = (now() at time zone 'UTC') + interval '1 second' * LEAST(
+                       %(base)s * power(2, LEAST(COALESCE(retry_count, 0), 20)),
+                       %(maximum)s
+                   ) * (0.5 + random() / 2),
+                   retry_count = COALESCE(retry_count, 0) + 1
+             WHERE id IN %(ids)s
+         RETURNING next_retry_at
+        """, {'base': base, 'maximum': maximum, 'ids': tuple(self.ids)})
+        first_retry = min(row[0] for row in self.env.cr.fetchall())
+        self.invalidate_cache(['retry_count', 'next_retry_at'], self.ids)
+        
+        cron = self.env.ref('bom_zns_simple.ir_cron_bom_zns_dispatch', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger(first_retry)
+    
     def name_get(self):
         """Override name_get to show template name and recipient"""
         result = []
@@ -76,6 +449,17 @@ class BomZnsHistory(models.Model):
             result.append((record.id, name))
         return result
     
+    def action_send_now(self):
+        """Send queued messages immediately instead of waiting for the dispatcher
+        
+        The messages are claimed like the dispatcher does, so those it is
+        already sending are skipped instead of being sent twice.
+        """
+        Zns = self.env['bom.zns']
+        queued = Zns._claim_queued_messages(len(self), history_ids=self.ids)
+        if queued:
+            Zns._dispatch_messages(queued)
+    
     def action_mark_as_sent(self):
         """Manually mark message as sent"""
         for record in self:
@@ -99,54 +483,27 @@ class BomZnsHistory(models.Model):
     
     def action_mark_as_failed(self, error_message=None):
         """Manually mark message as failed"""
-        for record in self:
-            vals = {'state': 'failed'}
-            if error_message:
-                vals['error_message'] = error_message
-            record.write(vals)
+        vals = {'state': 'failed'}
+        if error_message:
+            vals['error_message'] = error_message
+        self.write(vals)
     
     def action_retry_sending(self):
-        """Retry sending failed messages"""
-        for record in self:
-            if record.state == 'failed' and record.template_id and record.message_params:
-                # Initialize ZNS API handler
-                zns_api = self.env['bom.zns'].create({})
-                
-                # Parse message parameters
-                try:
-                    params = json.loads(record.message_params)
-                except Exception as e:
-                    record.write({
-                        'error_message': f"Failed to parse message parameters: {str(e)}",
-                    })
-                    continue
-                
-                # Retry sending message
-                result = zns_api.send_zns_message(
-                    template_id=record.template_id.id,
-                    phone=record.phone,
-                    params=params,
-                    partner_id=record.partner_id.id if record.partner_id else False,
-                    model=record.model,
-                    res_id=record.res_id,
-                    is_test=record.is_test,
-                )
-                
-                if result.get('success'):
-                    # Update existing record with new information
-                    record.write({
-                        'message_id': result.get('message_id'),
-                        'state': 'sent',
-                        'error_message': False,
-                        'bom_response': result.get('response'),
-                        'request_data': result.get('request_data'),
-                    })
-                else:
-                    # Update error message
-                    record.write({
-                        'error_message': result.get('error'),
-                        'debug_information': result.get('debug_info'),
-                    })
+        """Retry sending failed messages
+        
+        The original history records are sent again, so a message keeps a
+        single history row whatever the number of attempts.
+        """
+        to_retry = self.filtered(lambda r: r.state == 'failed' and r.template_id and r.message_params)
+        if not to_retry:
+            return
+        to_retry.write({
+            'state': 'draft',
+            'message_id': False,
+            'error_message': False,
+            'next_retry_at': False,
+        })
+        self.env['bom.zns']._dispatch_messages(to_retry)
     
     def action_view_related_record(self):
         """Open the related record if it exists"""
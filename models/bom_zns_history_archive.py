@@ -0,0 +1,154 @@
+import logging
+import base64
+import json
+import threading
+import zlib
+from datetime import timedelta
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+# Bulky history columns folded into the compressed payload of an archive row
+PAYLOAD_FIELDS = ('message_params', 'message_content', 'request_data', 'bom_response', 'debug_information')
+
+# Columns copied as they are from the history
+ARCHIVE_COLUMNS = (
+    'message_id', 'state', 'company_id', 'config_id', 'template_id', 'template_code', 'template_type',
+    'partner_id', 'user_id', 'model', 'res_id', 'phone', 'is_test', 'error_message',
+    'delivery_date', 'read_date', 'retry_count', 'idempotency_key',
+)
+
+class BomZnsHistoryArchive(models.Model):
+    _name = 'bom.zns.history.archive'
+    _description = 'BOM ZNS Archived Message'
+    _log_access = False
+    _rec_name = 'message_id'
+    _order = 'date desc, id desc'
+    
+    history_id = fields.Integer('Original ID', readonly=True)
+    date = fields.Datetime('Date', readonly=True, index=True, help='Creation date of the message')
+    message_id = fields.Char('Message ID', readonly=True, index=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('delivered', 'Delivered'),
+        ('read', 'Read'),
+        ('failed', 'Failed'),
+    ], string='Status', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True, ondelete='set null')
+    config_id = fields.Many2one('bom.zns.config', string='ZNS Configuration', readonly=True, ondelete='set null')
+    template_id = fields.Many2one('bom.zns.template', string='Template', readonly=True, ondelete='set null')
+    template_code = fields.Char('Template Code', readonly=True)
+    template_type = fields.Selection([
+        ('transaction', 'Transaction'),
+        ('otp', 'OTP'),
+        ('promotion', 'Promotion'),
+    ], string='Template Type', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Recipient', readonly=True, ondelete='set null', index=True)
+    user_id = fields.Many2one('res.users', string='Sent By', readonly=True, ondelete='set null')
+    model = fields.Char('Related Document Model', readonly=True)
+    res_id = fields.Integer('Related Document ID', readonly=True)
+    phone = fields.Char('Phone Number', readonly=True)
+    is_test = fields.Boolean('Test Message', readonly=True)
+    error_message = fields.Text('Error Message', readonly=True)
+    delivery_date = fields.Datetime('Delivery Date', readonly=True)
+    read_date = fields.Datetime('Read Date', readonly=True)
+    retry_count = fields.Integer('Retries', readonly=True)
+    idempotency_key = fields.Char('Idempotency Key', readonly=True, index=True,
+                                  help='Still checked when sending, so an archived message is never sent again')
+    
+    # Base64 of the zlib-compressed JSON of the bulky history columns
+    payload = fields.Binary('Payload', attachment=False, readonly=True)
+    message_params = fields.Text('Message Parameters', compute='_compute_payload')
+    message_content = fields.Text('Message Content', compute='_compute_payload')
+    request_data = fields.Text('Request Data', compute='_compute_payload')
+    bom_response = fields.Text('BOM API Response', compute='_compute_payload')
+    debug_information = fields.Text('Debug Information', compute='_compute_payload')
+    
+    def _compute_payload(self):
+        # bin_size would give the size of the payload instead of its content
+        payloads = {archive.id: archive.payload for archive in self.with_context(bin_size=False)}
+        for archive in self:
+            try:
+                payload = payloads.get(archive.id)
+                data = json.loads(zlib.decompress(base64.b64decode(payload))) if payload else {}
+            except Exception:
+                data = {}
+            for field in PAYLOAD_FIELDS:
+                archive[field] = data.get(field) or False
+    
+    @api.model
+    def _archive_histories(self, histories):
+        """Move history records to the archive
+        
+        The rows are copied with a single INSERT, their bulky columns folded
+        into one compressed payload, then the history records are deleted.
+        """
+        if not histories:
+            return
+        histories.flush()
+        columns = ('id', 'create_date', 'bom_response_zip') + ARCHIVE_COLUMNS + PAYLOAD_FIELDS
+        self.env.cr.execute(
+            "SELECT {} FROM bom_zns_history WHERE id IN %s".format(", ".join(columns)),
+            (tuple(histories.ids),))
+        rows = []
+        for row in self.env.cr.dictfetchall():
+            if not row['bom_response'] and row['bom_response_zip']:
+                row['bom_response'] = zlib.decompress(base64.b64decode(bytes(row['bom_response_zip']))).decode()
+            payload = {field: row[field] for field in PAYLOAD_FIELDS if row[field]}
+            rows.append([row['id'], row['create_date']]
+                        + [row[column] for column in ARCHIVE_COLUMNS]
+                        + [base64.b64encode(zlib.compress(json.dumps(payload).encode(), 9))])
+        
+        query = """
+            INSERT INTO bom_zns_history_archive (history_id, date, {}, payload)
+            VALUES {}
+        """.format(", ".join(ARCHIVE_COLUMNS),
+                   ", ".join(["({})".format(", ".join(["%s"] * (len(ARCHIVE_COLUMNS) + 3)))] * len(rows)))
+        self.env.cr.execute(query, [value for row in rows for value in row])
+        
+        # Through the ORM, so chatter, status events and partner counters follow
+        histories.sudo().with_context(bom_zns_archiving=True).unlink()
+    
+    @api.model
+    def cron_archive_history(self, batch_size=None):
+        """Scheduled action to move old messages to the archive
+        
+        Messages in a final state and older than the number of days set in
+        the bom_zns_simple.archive_after_days system parameter (0 disables
+        archiving) are archived in batches.
+        """
+        IrConfig = self.env['ir.config_parameter'].sudo()
+        days = int(IrConfig.get_param('bom_zns_simple.archive_after_days', '180'))
+        if days <= 0:
+            return True
+        if not batch_size:
+            batch_size = int(IrConfig.get_param('bom_zns_simple.archive_batch_size', '1000'))
+        
+        History = self.env['bom.zns.history'].sudo()
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        domain = [
+            ('create_date', '<', fields.Datetime.now() - timedelta(days=days)),
+            ('state', 'in', ('sent', 'delivered', 'read', 'failed')),
+        ]
+        while True:
+            histories = History.search(domain, order='id', limit=batch_size)
+            if not histories:
+                break
+            self._archive_histories(histories)
+            _logger.info(f"Archived {len(histories)} ZNS message(s)")
+            if not auto_commit:
+                break
+            self.env.cr.commit()
+        
+        return True
+    
+    def name_get(self):
+        result = []
+        for archive in self:
+            name = archive.message_id or _('Archived Message')
+            if archive.partner_id:
+                name = f"{name} - {archive.partner_id.name}"
+            result.append((archive.id, name))
+        return result
@@ -0,0 +1,15 @@
+from odoo import api, fields, models, _
+
+class BomZnsHistoryEvent(models.Model):
+    _name = 'bom.zns.history.event'
+    _description = 'BOM ZNS Message Status Event'
+    _log_access = False
+    _order = 'date, id'
+    
+    history_id = fields.Many2one('bom.zns.history', string='Message', required=True,
+                                 index=True, ondelete='cascade')
+    state = fields.Char('Status', readonly=True)
+    date = fields.Datetime('Date', readonly=True, default=fields.Datetime.now)
+    user_id = fields.Many2one('res.users', string='User', readonly=True,
+                              default=lambda self: self.env.uid)
+    error_message = fields.Text('Error Message', readonly=True)
@@ -0,0 +1,104 @@
+import logging
+from datetime import datetime, timedelta
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+class BomZnsRateLimit(models.Model):
+    _name = 'bom.zns.rate.limit'
+    _description = 'BOM ZNS Rate Limit Bucket'
+    _log_access = False
+    _rec_name = 'config_id'
+    
+    config_id = fields.Many2one('bom.zns.config', string='Configuration', required=True,
+                                ondelete='cascade', readonly=True)
+    tokens = fields.Float('Available Tokens', readonly=True)
+    refill_date = fields.Datetime('Last Refill', readonly=True)
+    day = fields.Date('Day', readonly=True, help='Day (UTC) counted by the daily cap')
+    day_count = fields.Integer('Sent on Day', readonly=True)
+    
+    _sql_constraints = [
+        ('config_uniq', 'unique(config_id)', 'Only one rate limit bucket per configuration is allowed.')
+    ]
+    
+    @api.model
+    def _acquire(self, config, count):
+        """Take up to count sending slots from the token bucket of a configuration
+        
+        The bucket is stored in the database and updated in its own short
+        transaction, so the quota is shared by all Odoo workers and the row
+        lock is never held during the API calls.
+        
+        :param config: bom.zns.config record
+        :param count: Number of messages to send
+        :return: Tuple (number of messages allowed, seconds to wait before
+                 the remaining ones can be sent)
+        """
+        rate = config.rate_limit or 0.0
+        daily_cap = config.daily_cap or 0
+        if count <= 0 or (rate <= 0 and daily_cap <= 0):
+            return count, 0
+        burst = max(config.rate_burst or 0, 1)
+        
+        try:
+            with self.pool.cursor() as cr:
+                cr.execute("""
+                    INSERT INTO bom_zns_rate_limit (config_id, tokens, refill_date, day, day_count)
+                    VALUES (%s, %s, now() at time zone 'UTC', (now() at time zone 'UTC')::date, 0)
+                    ON CONFLICT (config_id) DO NOTHING
+                """, (config.id, burst))
+                cr.execute("""
+                    SELECT tokens, refill_date, day, day_count, now() at time zone 'UTC'
+                      FROM bom_zns_rate_limit
+                     WHERE config_id = %s
+                       FOR UPDATE
+                """, (config.id,))
+                tokens, refill_date, day, day_count, now = cr.fetchone()
+                
+                if day != now.date():
+                    day, day_count = now.date(), 0
+                
+                granted = count
+                if rate > 0:
+                    elapsed = max((now - refill_date).total_seconds(), 0.0)
+                    tokens = min(float(burst), tokens + elapsed * rate)
+                    granted = min(granted, int(tokens))
+                if daily_cap > 0:
+                    granted = min(granted, max(daily_cap - day_count, 0))
+                
+                if rate > 0:
+                    tokens -= granted
+                day_count += granted
+                cr.execute("""
+                    UPDATE bom_zns_rate_limit
+                       SET tokens = %s, refill_date = %s, day = %s, day_count = %s
+                     WHERE config_id = %s
+                """, (tokens, now, day, day_count, config.id))
+        except Exception:
+            # Never block sending because the bucket cannot be updated, e.g.
+            # for a configuration that is not committed yet
+            _logger.warning("ZNS rate limit bucket of configuration %s unavailable", config.id, exc_info=True)
+            return count, 0
+        
+        if granted == count:
+            return granted, 0
+        if daily_cap > 0 and day_count >= daily_cap:
+            wait = (datetime.combine(day + timedelta(days=1), datetime.min.time()) - now).total_seconds()
+        else:
+            wait = (min(count - granted, burst) - tokens) / rate
+        return granted, max(wait, 1)
+    
+    @api.model
+    def _drain(self, config):
+        """Empty the bucket of a configuration after BOM rejected a request for quota"""
+        if not config.rate_limit or config.rate_limit <= 0:
+            return
+        try:
+            with self.pool.cursor() as cr:
+                cr.execute("""
+                    UPDATE bom_zns_rate_limit
+                       SET tokens = LEAST(tokens, 0), refill_date = now() at time zone 'UTC'
+                     WHERE config_id = %s
+                """, (config.id,))
+        except Exception:
+            _logger.warning("ZNS rate limit bucket of configuration %s unavailable", config.id, exc_info=True)
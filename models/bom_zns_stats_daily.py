@@ -0,0 +1,369 @@
+import logging
+import threading
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+# Delivery latency histogram: (field name, upper bound in seconds)
+LATENCY_BUCKETS = [
+    ('latency_10s', 10),
+    ('latency_30s', 30),
+    ('latency_1m', 60),
+    ('latency_5m', 300),
+    ('latency_15m', 900),
+    ('latency_1h', 3600),
+    ('latency_6h', 21600),
+    ('latency_more', None),
+]
+
+COUNTERS = [
+    'total_count',
+    'queued_count',
+    'sent_count',
+    'delivered_count',
+    'read_count',
+    'failed_count',
+    'latency_sum',
+] + [name for name, bound in LATENCY_BUCKETS]
+
+KEY_COLUMNS = ['company_id', 'config_id', 'template_id', 'day']
+
+# Adds the counters of rows inserted into bom_zns_stats_daily to the existing rows
+UPSERT = """
+    ON CONFLICT (COALESCE(company_id, 0), COALESCE(config_id, 0), COALESCE(template_id, 0), day)
+    DO UPDATE SET template_type = COALESCE(EXCLUDED.template_type, bom_zns_stats_daily.template_type),
+                  {}
+""".format(", ".join(
+    f"{name} = COALESCE(bom_zns_stats_daily.{name}, 0) + EXCLUDED.{name}" for name in COUNTERS
+))
+
+# Columns of a logged increment, in the order of the keys built by _get_history_counts
+DELTA_COLUMNS = ['company_id', 'config_id', 'template_id', 'template_type', 'day'] + COUNTERS
+
+class BomZnsStatsDelta(models.Model):
+    _name = 'bom.zns.stats.delta'
+    _description = 'BOM ZNS Statistics Increment'
+    _log_access = False
+    _order = 'id'
+    
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    config_id = fields.Many2one('bom.zns.config', string='ZNS Configuration', readonly=True)
+    template_id = fields.Many2one('bom.zns.template', string='Template', readonly=True)
+    template_type = fields.Selection([
+        ('transaction', 'Transaction'),
+        ('otp', 'OTP'),
+        ('promotion', 'Promotion'),
+    ], string='Template Type', readonly=True)
+    day = fields.Date('Day', required=True, readonly=True)
+    
+    total_count = fields.Integer('Messages', readonly=True)
+    queued_count = fields.Integer('Queued', readonly=True)
+    sent_count = fields.Integer('Sent', readonly=True)
+    delivered_count = fields.Integer('Delivered', readonly=True)
+    read_count = fields.Integer('Read', readonly=True)
+    failed_count = fields.Integer('Failed', readonly=True)
+    latency_sum = fields.Float('Total Latency (s)', readonly=True)
+    latency_10s = fields.Integer('Delivered in 10s', readonly=True)
+    latency_30s = fields.Integer('Delivered in 30s', readonly=True)
+    latency_1m = fields.Integer('Delivered in 1 min', readonly=True)
+    latency_5m = fields.Integer('Delivered in 5 min', readonly=True)
+    latency_15m = fields.Integer('Delivered in 15 min', readonly=True)
+    latency_1h = fields.Integer('Delivered in 1 hour', readonly=True)
+    latency_6h = fields.Integer('Delivered in 6 hours', readonly=True)
+    latency_more = fields.Integer('Delivered after 6 hours', readonly=True)
+
+class BomZnsStatsDaily(models.Model):
+    _name = 'bom.zns.stats.daily'
+    _description = 'BOM ZNS Daily Statistics'
+    _log_access = False
+    _order = 'day desc, id desc'
+    _rec_name = 'day'
+    
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    config_id = fields.Many2one('bom.zns.config', string='ZNS Configuration', readonly=True)
+    template_id = fields.Many2one('bom.zns.template', string='Template', readonly=True)
+    template_type = fields.Selection([
+        ('transaction', 'Transaction'),
+        ('otp', 'OTP'),
+        ('promotion', 'Promotion'),
+    ], string='Template Type', readonly=True)
+    day = fields.Date('Day', required=True, readonly=True)
+    
+    # Counters, by current state of the messages: a read message counts as
+    # sent, delivered and read, draft messages are the remainder
+    total_count = fields.Integer('Messages', readonly=True)
+    queued_count = fields.Integer('Queued', readonly=True)
+    sent_count = fields.Integer('Sent', readonly=True)
+    delivered_count = fields.Integer('Delivered', readonly=True)
+    read_count = fields.Integer('Read', readonly=True)
+    failed_count = fields.Integer('Failed', readonly=True)
+    
+    # Delivery latency histogram
+    latency_sum = fields.Float('Total Latency (s)', readonly=True)
+    latency_10s = fields.Integer('Delivered in 10s', readonly=True)
+    latency_30s = fields.Integer('Delivered in 30s', readonly=True)
+    latency_1m = fields.Integer('Delivered in 1 min', readonly=True)
+    latency_5m = fields.Integer('Delivered in 5 min', readonly=True)
+    latency_15m = fields.Integer('Delivered in 15 min', readonly=True)
+    latency_1h = fields.Integer('Delivered in 1 hour', readonly=True)
+    latency_6h = fields.Integer('Delivered in 6 hours', readonly=True)
+    latency_more = fields.Integer('Delivered after 6 hours', readonly=True)
+    
+    latency_avg = fields.Float('Average Latency (s)', compute='_compute_latency')
+    latency_p50 = fields.Float('Latency P50 (s)', compute='_compute_latency',
+                               help='Upper bound of the latency bucket holding the median delivery')
+    latency_p90 = fields.Float('Latency P90 (s)', compute='_compute_latency')
+    latency_p99 = fields.Float('Latency P99 (s)', compute='_compute_latency')
+    
+    def init(self):
+        # NULL keys must collide too, so the upsert target uses COALESCE
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS bom_zns_stats_daily_key_uniq
+                ON bom_zns_stats_daily (COALESCE(company_id, 0), COALESCE(config_id, 0),
+                                        COALESCE(template_id, 0), day)
+        """)
+    
+    def _compute_latency(self):
+        for stats in self:
+            counts = [stats[name] for name, bound in LATENCY_BUCKETS]
+            total = sum(counts)
+            stats.latency_avg = stats.latency_sum / total if total else 0.0
+            for field_name, ratio in (('latency_p50', 0.5), ('latency_p90', 0.9), ('latency_p99', 0.99)):
+                value = 0.0
+                if total:
+                    cumulated = 0
+                    for (name, bound), count in zip(LATENCY_BUCKETS, counts):
+                        cumulated += count
+                        value = bound or LATENCY_BUCKETS[-2][1]
+                        if cumulated >= ratio * total:
+                            break
+                stats[field_name] = value
+    
+    @api.model
+    def _get_latency_bucket(self, seconds):
+        for name, bound in LATENCY_BUCKETS:
+            if bound is None or seconds <= bound:
+                return name
+    
+    @api.model
+    def _add_counts(self, increments):
+        """Log counter increments with a single INSERT
+        
+        The increments are only appended to bom.zns.stats.delta and folded
+        into the daily rows by a scheduled action, so transactions sending
+        with the same template never wait on each other's daily row.
+        
+        :param increments: Dictionary mapping (company_id, config_id,
+                           template_id, template_type, day) to dictionaries
+                           of counter increments
+        """
+        if not increments:
+            return
+        params = []
+        for key, counters in increments.items():
+            params.extend(key)
+            params.extend(counters.get(name, 0) for name in COUNTERS)
+        row = "({})".format(", ".join(["%s"] * len(DELTA_COLUMNS)))
+        self.env.cr.execute("""
+            INSERT INTO bom_zns_stats_delta ({columns})
+            VALUES {rows}
+        """.format(
+            columns=", ".join(DELTA_COLUMNS),
+            rows=", ".join([row] * len(increments)),
+        ), params)
+    
+    @api.model
+    def _fold_deltas(self, limit):
+        """Add a batch of logged increments to the daily rows
+        
+        The batch is summed per daily row and upserted in key order, so two
+        concurrent folds always lock the daily rows in the same order.
+        
+        :param limit: Maximum number of logged increments to fold
+        :return: Number of folded increments
+        """
+        self.env.cr.execute("""
+            WITH claimed AS (
+                DELETE FROM bom_zns_stats_delta
+                 WHERE id IN (SELECT id FROM bom_zns_stats_delta
+                            ORDER BY id
+                               LIMIT %s
+                                 FOR UPDATE SKIP LOCKED)
+             RETURNING *
+            ), folded AS (
+                INSERT INTO bom_zns_stats_daily (company_id, config_id, template_id, template_type, day, {counters})
+                SELECT company_id, config_id, template_id, max(template_type), day, {sums}
+                  FROM claimed
+              GROUP BY company_id, config_id, template_id, day
+              ORDER BY COALESCE(company_id, 0), COALESCE(config_id, 0), COALESCE(template_id, 0), day
+                {upsert}
+            )
+            SELECT count(*) FROM claimed
+        """.format(
+            counters=", ".join(COUNTERS),
+            sums=", ".join(f"sum({name})" for name in COUNTERS),
+            upsert=UPSERT,
+        ), (limit,))
+        count = self.env.cr.fetchone()[0]
+        self.invalidate_cache()
+        return count
+    
+    @api.model
+    def _release_key(self, field_name, ids):
+        """Merge the daily rows of records about to be deleted into the rows without them
+        
+        The unique key counts NULL as a value, so letting the foreign key set
+        the column to NULL would make the rows of two deleted records collide.
+        Logged increments are nullified by the foreign key and folded later.
+        
+        :param field_name: 'company_id', 'config_id' or 'template_id'
+        :param ids: IDs of the records about to be deleted
+        """
+        if not ids:
+            return
+        kept = [name for name in ('company_id', 'config_id', 'template_id') if name != field_name]
+        keys = ", ".join("NULL" if name == field_name else name
+                         for name in ('company_id', 'config_id', 'template_id'))
+        self.flush()
+        self.env.cr.execute("""
+            WITH released AS (
+                DELETE FROM bom_zns_stats_daily
+                 WHERE {field} IN %s
+             RETURNING *
+            )
+            INSERT INTO bom_zns_stats_daily (company_id, config_id, template_id, template_type, day, {counters})
+            SELECT {keys}, max(template_type), day, {sums}
+              FROM released
+          GROUP BY {kept}, day
+          ORDER BY {order}, day
+            {upsert}
+        """.format(
+            field=field_name,
+            counters=", ".join(COUNTERS),
+            keys=keys,
+            sums=", ".join(f"sum({name})" for name in COUNTERS),
+            kept=", ".join(kept),
+            order=", ".join(f"COALESCE({name}, 0)" for name in kept),
+            upsert=UPSERT,
+        ), (tuple(ids),))
+        self.invalidate_cache()
+    
+    @api.model
+    def cron_fold_stats(self, batch_size=None):
+        """Scheduled action to add the logged increments to the daily statistics"""
+        if not batch_size:
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            batch_size = int(IrConfig.get_param('bom_zns_simple.stats_batch_size', '10000'))
+        
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        while self._fold_deltas(batch_size) >= batch_size and auto_commit:
+            self.env.cr.commit()
+        
+        return True
+    
+    @api.model
+    def _get_history_counts(self, histories):
+        """Get the counters messages add to their daily rows, from their current values
+        
+        Message counters follow the current state of each message, as a
+        funnel: a read message counts as sent, delivered and read. Counting
+        from the current values only, like rebuild_stats does in SQL, keeps
+        the live updates and a rebuild in agreement.
+        
+        :param histories: bom.zns.history records
+        :return: List of (key, counters) tuples, the key being (company_id,
+                 config_id, template_id, template_type, day)
+        """
+        result = []
+        for history in histories:
+            key = (
+                history.company_id.id or None,
+                history.config_id.id or None,
+                history.template_id.id or None,
+                history.template_type or None,
+                fields.Date.to_date(history.create_date or fields.Datetime.now()),
+            )
+            state = history.state
+            counters = {
+                'total_count': 1,
+                'queued_count': int(state == 'queued'),
+                'sent_count': int(state in ('sent', 'delivered', 'read')),
+                'delivered_count': int(state in ('delivered', 'read')),
+                'read_count': int(state == 'read'),
+                'failed_count': int(state == 'failed'),
+            }
+            if history.delivery_date and history.create_date:
+                latency = max((history.delivery_date - history.create_date).total_seconds(), 0.0)
+                counters[self._get_latency_bucket(latency)] = 1
+                counters['latency_sum'] = latency
+            result.append((key, counters))
+        return result
+    
+    @api.model
+    def _record_changes(self, old_counts, new_counts):
+        """Log the change of the counters of messages
+        
+        :param old_counts: Counters of the messages before the change, as
+                           returned by _get_history_counts, empty on create
+        :param new_counts: Counters of the messages after the change, empty
+                           on delete
+        """
+        increments = {}
+        for sign, counts in ((-1, old_counts), (1, new_counts)):
+            for key, counters in counts:
+                row = increments.setdefault(key, {})
+                for name, value in counters.items():
+                    row[name] = row.get(name, 0) + sign * value
+        self._add_counts({key: counters for key, counters in increments.items() if any(counters.values())})
+    
+    @api.model
+    def rebuild_stats(self, date_from=None):
+        """Recompute the daily statistics from the message history and its archive
+        
+        :param date_from: Only rebuild days from this date (all days if empty)
+        """
+        self.env['bom.zns.history'].flush()
+        self.env['bom.zns.history.archive'].flush()
+        day_filter = "WHERE h.create_date >= %(date_from)s" if date_from else ""
+        latency = "EXTRACT(EPOCH FROM h.delivery_date - h.create_date)"
+        buckets = []
+        lower = None
+        for name, bound in LATENCY_BUCKETS:
+            conditions = ["h.delivery_date IS NOT NULL"]
+            if lower is not None:
+                conditions.append(f"{latency} > {lower}")
+            if bound is not None:
+                conditions.append(f"{latency} <= {bound}")
+            buckets.append(f"count(*) FILTER (WHERE {' AND '.join(conditions)})")
+            lower = bound
+        
+        # Logged increments of the rebuilt days are counted again from the history
+        if date_from:
+            self.env.cr.execute("DELETE FROM bom_zns_stats_delta WHERE day >= %s", (date_from,))
+            self.env.cr.execute("DELETE FROM bom_zns_stats_daily WHERE day >= %s", (date_from,))
+        else:
+            self.env.cr.execute("DELETE FROM bom_zns_stats_delta")
+            self.env.cr.execute("DELETE FROM bom_zns_stats_daily")
+        self.env.cr.execute(f"""
+            INSERT INTO bom_zns_stats_daily (company_id, config_id, template_id, template_type, day, {", ".join(COUNTERS)})
+            SELECT h.company_id, h.config_id, h.template_id, max(h.template_type), h.create_date::date,
+                   count(*),
+                   count(*) FILTER (WHERE h.state = 'queued'),
+                   count(*) FILTER (WHERE h.state IN ('sent', 'delivered', 'read')),
+                   count(*) FILTER (WHERE h.state IN ('delivered', 'read')),
+                   count(*) FILTER (WHERE h.state = 'read'),
+                   count(*) FILTER (WHERE h.state = 'failed'),
+                   COALESCE(sum(GREATEST({latency}, 0)) FILTER (WHERE h.delivery_date IS NOT NULL), 0),
+                   {", ".join(buckets)}
+              FROM (SELECT company_id, config_id, template_id, template_type, create_date,
+                           state, delivery_date
+                      FROM bom_zns_history
+                 UNION ALL
+                    SELECT company_id, config_id, template_id, template_type, date,
+                           state, delivery_date
+                      FROM bom_zns_history_archive) h
+              {day_filter}
+          GROUP BY h.company_id, h.config_id, h.template_id, h.create_date::date
+        """, {'date_from': date_from})
+        self.invalidate_cache()
+        return True
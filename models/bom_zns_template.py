@@ -1,11 +1,27 @@
 import logging
-import requests
 import json
-from odoo import api, fields, models, _
+import hashlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from odoo import api, fields, models, tools, _
 from odoo.exceptions import UserError, ValidationError
 
 _logger = logging.getLogger(__name__)
 
+
+def _fetch_template(session, url, headers=None, timeout=30):
+    """Get a template from the BOM API
+    
+    Runs in worker threads, so it must not touch the ORM.
+    
+    :return: Tuple (status code, response text, ETag, exception)
+    """
+    try:
+        response = session.get(url, headers=headers, timeout=timeout)
+        return response.status_code, response.text, response.headers.get('ETag'), None
+    except Exception as e:
+        return None, None, None, e
+
 class BomZnsTemplate(models.Model):
     _name = 'bom.zns.template'
     _description = 'BOM ZNS Template'
@@ -24,6 +40,12 @@ class BomZnsTemplate(models.Model):
     template_content = fields.Text('Template Content', help='Content of the ZNS template')
     template_json = fields.Text('Template JSON', help='JSON representation of the template structure')
     
+    # Sync state, used to skip templates that did not change on BOM
+    sync_etag = fields.Char('Sync ETag', readonly=True, copy=False)
+    sync_hash = fields.Char('Sync Hash', readonly=True, copy=False,
+                            help='Hash of the template data last received from BOM')
+    sync_date = fields.Datetime('Last Sync Date', readonly=True, copy=False)
+    
     # ZNS Template properties according to BOM API
     template_type = fields.Selection([
         ('transaction', 'Transaction'),
@@ -62,15 +84,61 @@ class BomZnsTemplate(models.Model):
         """Override create to automatically set config_id if not provided"""
         if not vals.get('config_id'):
             company_id = vals.get('company_id', self.env.company.id)
-            config = self.env['bom.zns.config'].search([
-                ('company_id', '=', company_id),
-                ('active', '=', True)
-            ], limit=1)
-            if config:
-                vals['config_id'] = config.id
+            config_id = self.env['bom.zns.config']._get_company_config_id(company_id)
+            if config_id:
+                vals['config_id'] = config_id
         
         return super(BomZnsTemplate, self).create(vals)
     
+    def unlink(self):
+        self.env['bom.zns.stats.daily'].sudo()._release_key('template_id', self.ids)
+        return super(BomZnsTemplate, self).unlink()
+    
+    @api.model
+    def _safe_eval_enabled(self):
+        return self.env['bom.zns.config']._get_company_settings(self.env.company.id)['safe_eval']
+    
+    @api.model
+    @tools.ormcache('template_id')
+    def _get_compiled_params(self, template_id):
+        """Get the compiled parameters of a template
+        
+        Field paths, custom expressions and formatters are built once and
+        cached until a variant or a system parameter is written.
+        
+        :return: Tuple of CompiledParam, in variant order
+        """
+        template = self.sudo().with_context(active_test=False).browse(template_id).exists()
+        safe_eval_enabled = self._safe_eval_enabled()
+        return tuple(variant._compile(safe_eval_enabled) for variant in template.variant_ids)
+    
+    def _render_params(self, record):
+        """Build the message parameters of this template for a record
+        
+        :return: Dictionary mapping parameter names to formatted values
+        """
+        self.ensure_one()
+        return self._render_params_batch(record)[record.id]
+    
+    def _render_params_batch(self, records):
+        """Build the message parameters of this template for a recordset
+        
+        Every parameter is extracted and formatted as a column over all the
+        records, so each field path is read once for the whole recordset.
+        
+        :return: Dictionary mapping record IDs to parameter dictionaries
+        """
+        self.ensure_one()
+        columns = [
+            (param.param_name, param.render_column(records))
+            for param in self._get_compiled_params(self.id)
+            if param.active
+        ]
+        return {
+            record.id: {name: column[index] for name, column in columns}
+            for index, record in enumerate(records)
+        }
+    
     def sync_from_bom(self):
         """Sync template information from BOM API"""
         self.ensure_one()
@@ -80,113 +148,170 @@ class BomZnsTemplate(models.Model):
         if not self.template_code:
             raise UserError(_("Template code is required to sync from bom."))
         
-        try:
-            # Prepare headers
-            headers = {
-                'Content-Type': 'application/json',
-                'X-Api-Key': self.config_id.api_key,
-                'X-Api-Secret': self.config_id.api_secret,
+        return self.action_sync_from_bom()
+    
+    def action_sync_from_bom(self):
+        """Sync many templates from BOM API at once
+        
+        Templates are fetched concurrently. Those BOM reports as not modified
+        (ETag) or whose content hash did not change are skipped, and the
+        parameters of the others are applied with batched creates and writes.
+        """
+        result = self._sync_from_bom_bulk()
+        if result['failed']:
+            title, notification_type = _('Error'), 'danger'
+        else:
+            title, notification_type = _('Success'), 'success'
+        message = _("%(synced)s template(s) synced, %(unchanged)s unchanged, %(failed)s failed.") % {
+            'synced': len(result['synced']),
+            'unchanged': len(result['unchanged']),
+            'failed': len(result['failed']),
+        }
+        if result['failed']:
+            message += "\n" + "\n".join(result['failed'].values())
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': title,
+                'message': message,
+                'sticky': bool(result['failed']),
+                'type': notification_type,
             }
-            
-            # Make request to get template information
-            # Using the get-template endpoint (adjust according to actual BOM API)
-            response = requests.get(
-                f"{self.config_id.base_url}/template/{self.template_code}",
-                headers=headers
-            )
-            
+        }
+    
+    def _sync_from_bom_bulk(self):
+        """Fetch these templates from BOM API and apply the changes
+        
+        :return: Dictionary with the 'synced' and 'unchanged' templates and
+                 the 'failed' ones, mapping template IDs to error messages
+        """
+        result = {'synced': self.browse(), 'unchanged': self.browse(), 'failed': {}}
+        jobs = []
+        for template in self:
+            if not template.config_id or not template.template_code:
+                result['failed'][template.id] = _("%s: configuration and template code are required.") % template.name
+                continue
+            config = template.config_id
+            headers = {'If-None-Match': template.sync_etag} if template.sync_etag else None
+            jobs.append((template, config, config._get_session(),
+                         f"{config.base_url}/template/{template.template_code}", headers))
+        
+        if len(jobs) > 1:
+            workers = min(self.env['bom.zns.config']._get_company_settings(self.env.company.id)['sync_workers'], len(jobs))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(lambda job: _fetch_template(job[2], job[3], job[4]), jobs))
+        else:
+            responses = [_fetch_template(job[2], job[3], job[4]) for job in jobs]
+        
+        parameters = {}
+        now = fields.Datetime.now()
+        for (template, config, session, url, headers), (status_code, text, etag, exc) in zip(jobs, responses):
             # Log the response if debug mode is enabled
-            if self.config_id.debug_mode:
-                _logger.info(f"Sync Template Response: {response.text}")
+            if config.debug_mode and exc is None:
+                _logger.info(f"Sync Template Response: {text}")
             
-            # Process response
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Update template information
-                self.write({
-                    'name': data.get('name', self.name),
-                    'description': data.get('description', self.description),
-                    'template_type': data.get('type', self.template_type),
-                    'template_content': data.get('content', self.template_content),
-                    'template_json': json.dumps(data),
-                })
-                
-                # Sync template parameters/variants if available
-                if 'parameters' in data:
-                    self._sync_template_parameters(data['parameters'])
-                
-                self.message_post(body=_("Template synced successfully from BOM!"))
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': _('Success'),
-                        'message': _('Template synced successfully from BOM!'),
-                        'sticky': False,
-                        'type': 'success',
-                    }
-                }
-            else:
-                error_msg = f"Failed to sync template. Status code: {response.status_code}. Response: {response.text}"
+            if status_code == 304:
+                result['unchanged'] |= template
+                continue
+            
+            data = None
+            if exc is None and status_code == 200:
+                try:
+                    data = json.loads(text)
+                except Exception as e:
+                    exc = e
+            if data is None:
+                if exc is not None:
+                    error_msg = f"Failed to sync template: {str(exc)}"
+                else:
+                    error_msg = f"Failed to sync template. Status code: {status_code}. Response: {text}"
                 _logger.error(error_msg)
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': _('Error'),
-                        'message': error_msg,
-                        'sticky': False,
-                        'type': 'danger',
-                    }
-                }
-        except Exception as e:
-            error_msg = f"Failed to sync template: {str(e)}"
-            _logger.exception(error_msg)
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': _('Error'),
-                    'message': error_msg,
-                    'sticky': False,
-                    'type': 'danger',
-                }
-            }
+                result['failed'][template.id] = f"{template.name}: {error_msg}"
+                continue
+            
+            sync_hash = hashlib.sha1(json.dumps(data, sort_keys=True).encode()).hexdigest()
+            if sync_hash == template.sync_hash:
+                if etag != template.sync_etag:
+                    template.write({'sync_etag': etag})
+                result['unchanged'] |= template
+                continue
+            
+            # Update template information
+            template.write({
+                'name': data.get('name', template.name),
+                'description': data.get('description', template.description),
+                'template_type': data.get('type', template.template_type),
+                'template_content': data.get('content', template.template_content),
+                'template_json': json.dumps(data),
+                'sync_etag': etag,
+                'sync_hash': sync_hash,
+                'sync_date': now,
+            })
+            
+            # Sync template parameters/variants if available
+            if 'parameters' in data:
+                parameters[template.id] = data['parameters']
+            result['synced'] |= template
+        
+        self._sync_parameters_batch(parameters)
+        for template in result['synced']:
+            template.message_post(body=_("Template synced successfully from BOM!"))
+        return result
     
     def _sync_template_parameters(self, parameters):
         """Sync template parameters as variants"""
+        self.ensure_one()
+        self._sync_parameters_batch({self.id: parameters})
+    
+    @api.model
+    def _sync_parameters_batch(self, parameters):
+        """Sync the parameters of many templates as variants
+        
+        Existing variants are read with a single search and matched by
+        parameter name. Variants are then created with one create, and
+        updated with one write per distinct set of values.
+        
+        :param parameters: Dictionary mapping template IDs to the parameter
+                           list returned by BOM
+        """
+        if not parameters:
+            return
         Variant = self.env['bom.zns.variant']
+        existing = {
+            (variant.template_id.id, variant.param_name): variant
+            for variant in Variant.with_context(active_test=False).search([
+                ('template_id', 'in', list(parameters)),
+            ])
+        }
         
-        # Get existing variants for this template
-        existing_variants = Variant.search([('template_id', '=', self.id)])
-        existing_param_names = existing_variants.mapped('param_name')
+        to_create = []
+        to_write = defaultdict(list)
+        created = set()
+        for template_id, template_parameters in parameters.items():
+            for param in template_parameters:
+                param_name = param.get('name')
+                vals = {
+                    'param_type': param.get('type', 'text'),
+                    'required': param.get('required', False),
+                    'description': param.get('description', ''),
+                }
+                variant = existing.get((template_id, param_name))
+                if variant:
+                    if any((variant[field] or False) != (value or False) for field, value in vals.items()):
+                        to_write[tuple(sorted(vals.items()))].append(variant.id)
+                elif (template_id, param_name) not in created:
+                    to_create.append(dict(vals, **{
+                        'template_id': template_id,
+                        'name': param_name,  # Use parameter name as variant name
+                        'param_name': param_name,
+                    }))
+                    created.add((template_id, param_name))
         
-        # Create or update variants based on parameters
-        for param in parameters:
-            param_name = param.get('name')
-            param_type = param.get('type', 'text')
-            param_required = param.get('required', False)
-            param_description = param.get('description', '')
-            
-            if param_name in existing_param_names:
-                # Update existing variant
-                variant = existing_variants.filtered(lambda v: v.param_name == param_name)
-                variant.write({
-                    'param_type': param_type,
-                    'required': param_required,
-                    'description': param_description,
-                })
-            else:
-                # Create new variant
-                Variant.create({
-                    'template_id': self.id,
-                    'name': param_name,  # Use parameter name as variant name
-                    'param_name': param_name,
-                    'param_type': param_type,
-                    'required': param_required,
-                    'description': param_description,
-                })
+        for vals, variant_ids in to_write.items():
+            Variant.browse(variant_ids).write(dict(vals))
+        if to_create:
+            Variant.create(to_create)
     
     def action_view_variants(self):
         """Open the variants related to this template"""
@@ -1,5 +1,7 @@
 import logging
+from datetime import datetime
 from odoo import api, fields, models, _
+from odoo.tools.safe_eval import safe_eval
 
 _logger = logging.getLogger(__name__)
 
@@ -77,6 +79,53 @@ class BomZnsVariant(models.Model):
          'Parameter name must be unique per template!')
     ]
     
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(BomZnsVariant, self).create(vals_list)
+        self.clear_caches()
+        return records
+    
+    def write(self, vals):
+        result = super(BomZnsVariant, self).write(vals)
+        self.clear_caches()
+        return result
+    
+    def unlink(self):
+        result = super(BomZnsVariant, self).unlink()
+        self.clear_caches()
+        return result
+    
+    def _compile(self, safe_eval_enabled=False):
+        """Compile this parameter into a reusable renderer
+        
+        The result holds no reference to the environment, so it can be
+        cached across requests.
+        """
+        self.ensure_one()
+        extract = None
+        if self.field_model and self.field_name:
+            if self.field_model == 'custom':
+                extract = _compile_expression(self.field_name, self.default_value, safe_eval_enabled)
+            else:
+                extract = _compile_path(self.field_name, self.default_value)
+        
+        return CompiledParam(
+            variant_id=self.id,
+            param_name=self.param_name,
+            active=self.active,
+            extract=extract,
+            format=_compile_formatter(
+                param_type=self.param_type,
+                default_value=self.default_value,
+                field_format=self.field_format,
+                decimal_places=max(self.decimal_places or 0, 0),
+                thousand_separator=self.thousand_separator,
+                date_format=self.date_format or '%d/%m/%Y',
+                currency_symbol=self.currency_symbol or '₫',
+                currency_position=self.currency_position,
+            ),
+        )
+    
     def get_formatted_value(self, record=None, value=None):
         """Get formatted value for this parameter
         
@@ -84,78 +133,159 @@ class BomZnsVariant(models.Model):
         :param value: The explicit value to format (if record is not provided)
         :return: Formatted value according to parameter settings
         """
-        if record and self.field_model and self.field_name:
-            # Extract value from record
-            if self.field_model == 'custom':
-                # Using safe_eval to evaluate custom expressions with record
-                try:
-                    value = self.env['ir.config_parameter'].sudo().get_param('bom.zns.safe_eval', 'False').lower() == 'true'
-                    if value:
-                        value = self.env['ir.actions.server']._eval_context(record).get('record', record)
-                        value = safe_eval(self.field_name, {'record': value})
-                    else:
-                        _logger.warning("Safe eval disabled for security. Using default value instead.")
-                        value = self.default_value
-                except Exception as e:
-                    _logger.error(f"Error evaluating custom expression: {str(e)}")
-                    value = self.default_value
-            else:
-                # Direct field access
+        self.ensure_one()
+        compiled = self.template_id._get_compiled_params(self.template_id.id)
+        param = next((param for param in compiled if param.variant_id == self.id), None)
+        if param is None:
+            param = self._compile(self.template_id._safe_eval_enabled())
+        return param.render(record=record, value=value)
+
+
+class CompiledParam(object):
+    """Precompiled value extractor and formatter of a template parameter
+    
+    ``extract`` returns the column of raw values of a recordset, and
+    ``format`` turns a column of raw values into strings.
+    """
+    __slots__ = ('variant_id', 'param_name', 'active', 'extract', 'format')
+    
+    def __init__(self, variant_id, param_name, active, extract, format):
+        self.variant_id = variant_id
+        self.param_name = param_name
+        self.active = active
+        self.extract = extract
+        self.format = format
+    
+    def render(self, record=None, value=None):
+        return self.render_column(record, values=[value])[0]
+    
+    def render_column(self, records, values=None):
+        """Format this parameter for every record of a recordset
+        
+        :param records: Recordset to extract the values from
+        :param values: Explicit values, used when there is nothing to extract
+        :return: List of formatted values, in the order of records
+        """
+        if records and self.extract:
+            values = self.extract(records)
+        elif values is None:
+            values = [None] * len(records)
+        return self.format(values)
+
+
+def _compile_expression(expression, default_value, enabled):
+    """Build the function evaluating a custom expression with 'record' in scope"""
+    if not enabled:
+        def extract(records):
+            _logger.warning("Safe eval disabled for security. Using default value instead.")
+            return [default_value] * len(records)
+        return extract
+    
+    def evaluate(record):
+        try:
+            return safe_eval(expression, {'record': record})
+        except Exception as e:
+            _logger.error(f"Error evaluating custom expression: {str(e)}")
+            return default_value
+    
+    def extract(records):
+        return [evaluate(record) for record in records]
+    return extract
+
+
+def _compile_path(field_name, default_value):
+    """Compile a dotted field path once
+    
+    The path is resolved one level at a time over the whole recordset, so
+    each level costs one batched read whatever the number of records.
+    """
+    field_path = tuple(field_name.split('.'))
+    failed = object()
+    
+    def step(current, field):
+        if current is failed or not current:
+            return current
+        try:
+            return current[field] if hasattr(current, '__getitem__') else getattr(current, field, None)
+        except Exception as e:
+            _logger.error(f"Error getting field value: {str(e)}")
+            return failed
+    
+    def extract(records):
+        values = list(records)
+        for field in field_path:
+            # Fetch the field of all records reached at this level at once
+            targets = {}
+            for value in values:
+                if isinstance(value, models.BaseModel) and len(value) == 1 and field in value._fields:
+                    targets.setdefault(value._name, set()).add(value.id)
+            for model_name, ids in targets.items():
+                records.env[model_name].browse(ids).mapped(field)
+            values = [step(value, field) for value in values]
+        return [default_value if value is failed else value for value in values]
+    return extract
+
+
+def _compile_formatter(param_type, default_value, field_format, decimal_places, thousand_separator,
+                       date_format, currency_symbol, currency_position):
+    """Build the function formatting values of a parameter type"""
+    if param_type == 'number':
+        pattern = '{:,.%df}' % decimal_places if thousand_separator else '{:.%df}' % decimal_places
+        
+        def convert(value):
+            value = pattern.format(float(value) if value else 0.0)
+            return value.replace(',', ' ') if thousand_separator else value
+    
+    elif param_type == 'date':
+        def convert(value):
+            if not value:
+                return value
+            if isinstance(value, str):
+                # Try to parse the string as a date
                 try:
-                    field_path = self.field_name.split('.')
-                    current = record
-                    for field in field_path:
-                        if not current:
-                            break
-                        current = current[field] if hasattr(current, '__getitem__') else getattr(current, field, None)
-                    value = current
-                except Exception as e:
-                    _logger.error(f"Error getting field value: {str(e)}")
-                    value = self.default_value
+                    return datetime.strptime(value, '%Y-%m-%d').strftime(date_format)
+                except Exception:
+                    return value
+            # Assume it's a datetime object
+            return value.strftime(date_format)
+    
+    elif param_type == 'currency':
+        pattern = '{:,.%df}' % decimal_places
+        if currency_position == 'before':
+            template = currency_symbol + '{}'
+        else:
+            template = '{}' + currency_symbol
         
+        def convert(value):
+            if not value:
+                return value
+            return template.format(pattern.format(float(value)).replace(',', ' '))
+    
+    else:
+        def convert(value):
+            return value
+    
+    def format_value(value):
         # If no value yet, use default
         if value is None:
-            value = self.default_value
+            value = default_value
         
         # Format the value according to its type
         try:
-            if self.param_type == 'number':
-                value = float(value) if value else 0.0
-                if self.thousand_separator:
-                    value = '{:,.{prec}f}'.format(value, prec=self.decimal_places).replace(',', ' ')
-                else:
-                    value = '{:.{prec}f}'.format(value, prec=self.decimal_places)
-            
-            elif self.param_type == 'date' and value:
-                if isinstance(value, str):
-                    # Try to parse the string as a date
-                    try:
-                        from datetime import datetime
-                        value = datetime.strptime(value, '%Y-%m-%d').strftime(self.date_format or '%d/%m/%Y')
-                    except Exception:
-                        pass
-                else:
-                    # Assume it's a datetime object
-                    value = value.strftime(self.date_format or '%d/%m/%Y')
-            
-            elif self.param_type == 'currency' and value:
-                value = float(value) if value else 0.0
-                formatted_value = '{:,.{prec}f}'.format(value, prec=self.decimal_places).replace(',', ' ')
-                
-                if self.currency_position == 'before':
-                    value = f"{self.currency_symbol or '₫'}{formatted_value}"
-                else:
-                    value = f"{formatted_value}{self.currency_symbol or '₫'}"
+            value = convert(value)
             
             # Apply custom format if specified
-            if self.field_format and value is not None:
+            if field_format and value is not None:
                 try:
-                    value = self.field_format.format(value)
+                    value = field_format.format(value)
                 except Exception as e:
                     _logger.error(f"Error formatting value: {str(e)}")
-            
         except Exception as e:
             _logger.error(f"Error formatting parameter value: {str(e)}")
-            value = self.default_value
+            value = default_value
         
-        return str(value) if value is not None else ""
\ No newline at end of file
+        return str(value) if value is not None else ""
+    
+    def format_column(values):
+        return list(map(format_value, values))
+    return format_column
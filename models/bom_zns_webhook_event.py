@@ -0,0 +1,118 @@
+import logging
+import json
+import threading
+from datetime import timedelta
+from odoo import api, fields, models, _
+
+_logger = logging.getLogger(__name__)
+
+# When several events arrive for the same message, the highest rank wins
+STATUS_RANK = {
+    'delivered': 1,
+    'failed': 2,
+    'read': 3,
+}
+
+class BomZnsWebhookEvent(models.Model):
+    _name = 'bom.zns.webhook.event'
+    _description = 'BOM ZNS Webhook Event'
+    _log_access = False
+    _order = 'id'
+    
+    message_id = fields.Char('Message ID', readonly=True)
+    status = fields.Char('Status', readonly=True)
+    payload = fields.Text('Payload', readonly=True, help='Raw data received from BOM')
+    received_date = fields.Datetime('Received Date', readonly=True, default=fields.Datetime.now)
+    
+    @api.model
+    def _ingest(self, events):
+        """Store raw webhook events with a single INSERT
+        
+        :param events: List of dictionaries posted by BOM
+        :return: Tuple (number of stored events, number of rejected events)
+        """
+        rows = []
+        for event in events:
+            if not isinstance(event, dict) or not event.get('message_id') or not event.get('status'):
+                continue
+            rows.append((str(event['message_id']), str(event['status']), json.dumps(event)))
+        
+        if rows:
+            query = """
+                INSERT INTO bom_zns_webhook_event (message_id, status, payload, received_date)
+                VALUES {}
+            """.format(", ".join(["(%s, %s, %s, now() at time zone 'UTC')"] * len(rows)))
+            self.env.cr.execute(query, [value for row in rows for value in row])
+        return len(rows), len(events) - len(rows)
+    
+    @api.model
+    def _claim_events(self, limit, after_id=0):
+        self.env.cr.execute("""
+            SELECT id, message_id, status, payload, received_date
+              FROM bom_zns_webhook_event
+             WHERE id > %s
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, (after_id, limit))
+        return self.env.cr.fetchall()
+    
+    @api.model
+    def _process_events(self, rows):
+        """Fold a batch of raw events into the message history
+        
+        Events are reduced to one status per message, the matching history
+        records are fetched with a single search and updated in bulk.
+        Events whose message is unknown are kept for an hour in case the
+        webhook overtook the send transaction, then dropped.
+        """
+        latest = {}
+        for event_id, message_id, status, payload, received_date in rows:
+            current = latest.get(message_id)
+            if not current or STATUS_RANK.get(status, 0) >= STATUS_RANK.get(current[1], 0):
+                latest[message_id] = (event_id, status, payload)
+        
+        History = self.env['bom.zns.history'].sudo()
+        histories = History.search([('message_id', 'in', list(latest))])
+        updates = {}
+        for history in histories:
+            event_id, status, payload = latest[history.message_id]
+            try:
+                message = json.loads(payload).get('message')
+            except Exception:
+                message = None
+            updates[history.id] = (status, message)
+        # Tracked or event-logged according to the logging mode of each configuration
+        histories._apply_status_updates(updates)
+        
+        known = set(histories.mapped('message_id'))
+        expiry = fields.Datetime.now() - timedelta(hours=1)
+        done_ids = [
+            event_id
+            for event_id, message_id, status, payload, received_date in rows
+            if message_id in known or received_date < expiry
+        ]
+        if done_ids:
+            self.env.cr.execute("DELETE FROM bom_zns_webhook_event WHERE id IN %s", (tuple(done_ids),))
+        return len(done_ids)
+    
+    @api.model
+    def cron_process_webhook_events(self, batch_size=None):
+        """Scheduled action to apply received webhook events to the history"""
+        if not batch_size:
+            IrConfig = self.env['ir.config_parameter'].sudo()
+            batch_size = int(IrConfig.get_param('bom_zns_simple.webhook_batch_size', '1000'))
+        
+        auto_commit = not getattr(threading.current_thread(), 'testing', False)
+        last_id = 0
+        while True:
+            rows = self._claim_events(batch_size, after_id=last_id)
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            self._process_events(rows)
+            if not auto_commit:
+                break
+            self.env.cr.commit()
+        
+        return True
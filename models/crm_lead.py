@@ -26,68 +26,29 @@ class Lead(models.Model):
                                      domain=[('model', '=', 'crm.lead')], readonly=True)
     
     def write(self, vals):
-        # Store old stage
-        old_stage_ids = {lead.id: lead.stage_id.id for lead in self}
+        # Only a move into a won stage can trigger the automatic message
+        if not vals.get('stage_id'):
+            return super(Lead, self).write(vals)
         
-        # Call original method
-        result = super(Lead, self).write(vals)
-        
-        # Check if stage changed
-        if 'stage_id' in vals:
-            # Check if auto-send is enabled in config
-            IrConfig = self.env['ir.config_parameter'].sudo()
-            if IrConfig.get_param('bom_zns_simple.auto_send_crm', 'False').lower() == 'true':
-                # Get won stage ids
-                won_stage_ids = self.env['crm.stage'].search([('is_won', '=', True)]).ids
-                
-                # Send ZNS for opportunities that moved to won stage
-                for lead in self:
-                    if (lead.stage_id.id in won_stage_ids and 
-                            old_stage_ids.get(lead.id) not in won_stage_ids and
-                            not lead.zns_sent):
-                        lead._send_opportunity_won_zns()
+        settings = self.env['bom.zns.config']._get_company_settings(self.env.company.id)
+        won_stage_ids = self.env['crm.stage']._get_won_stage_ids()
+        if not settings['auto_send_crm'] or vals['stage_id'] not in won_stage_ids:
+            return super(Lead, self).write(vals)
         
+        # Leads outside of won stages are the ones becoming won
+        won_leads = self.filtered(lambda lead: lead.stage_id.id not in won_stage_ids and not lead.zns_sent)
+        result = super(Lead, self).write(vals)
+        self.env['bom.zns']._schedule_auto_send(won_leads, 'crm_template_id')
         return result
     
+    def _filter_zns_auto_send(self):
+        """Get the leads still eligible for their won opportunity ZNS"""
+        won_stage_ids = self.env['crm.stage']._get_won_stage_ids()
+        return self.filtered(lambda lead: lead.stage_id.id in won_stage_ids)
+    
     def _send_opportunity_won_zns(self):
-        self.ensure_one()
-        if self.zns_sent:
-            return
-            
-        # Get template from settings
-        IrConfig = self.env['ir.config_parameter'].sudo()
-        template_id = int(IrConfig.get_param('bom_zns_simple.crm_template_id', '0'))
-        if not template_id:
-            return
-            
-        template = self.env['bom.zns.template'].browse(template_id).exists()
-        if not template or not self.partner_id or not self.partner_id.zalo_opt_in:
-            return
-            
-        # Get phone number
-        phone = self.partner_id.zalo_phone or self.partner_id.mobile or self.partner_id.phone
-        if not phone:
-            return
-            
-        # Prepare parameters
-        params = {}
-        for variant in template.variant_ids.filtered(lambda v: v.active):
-            params[variant.param_name] = variant.get_formatted_value(record=self)
-        
-        # Send ZNS
-        zns_api = self.env['bom.zns'].create({})
-        result = zns_api.send_zns_message(
-            template_id=template.id,
-            phone=phone,
-            params=params,
-            partner_id=self.partner_id.id,
-            model='crm.lead',
-            res_id=self.id,
-            is_test=False
-        )
-        
-        if result.get('success'):
-            self.zns_sent = True
+        """Queue the won opportunity ZNS of these leads right away"""
+        self.env['bom.zns']._enqueue_auto_send(self, 'crm_template_id')
     
     def action_send_zns(self):
         """Manual ZNS sending action"""
@@ -0,0 +1,30 @@
+from odoo import api, models, tools
+
+class Stage(models.Model):
+    _inherit = 'crm.stage'
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        stages = super(Stage, self).create(vals_list)
+        if any(vals.get('is_won') for vals in vals_list):
+            self.clear_caches()
+        return stages
+    
+    def write(self, vals):
+        result = super(Stage, self).write(vals)
+        if 'is_won' in vals:
+            self.clear_caches()
+        return result
+    
+    def unlink(self):
+        won = any(stage.is_won for stage in self)
+        result = super(Stage, self).unlink()
+        if won:
+            self.clear_caches()
+        return result
+    
+    @api.model
+    @tools.ormcache()
+    def _get_won_stage_ids(self):
+        """Get the IDs of the won stages, cached until a stage changes"""
+        return frozenset(self.sudo().search([('is_won', '=', True)]).ids)
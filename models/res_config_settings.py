@@ -89,7 +89,7 @@ class ResConfigSettings(models.TransientModel):
         IrParam.set_param('bom.zns.safe_eval', str(self.bom_zns_safe_eval))
         
         # Update cron job interval if it exists
-        cron_job = self.env.ref('bom.bom_zns_cron_check_status', raise_if_not_found=False)
+        cron_job = self.env.ref('bom_zns_simple.bom_zns_cron_check_status', raise_if_not_found=False)
         if cron_job and self.bom_zns_check_interval:
             # Convert minutes to cron interval
             cron_job.interval_number = self.bom_zns_check_interval
@@ -1,5 +1,5 @@
 import logging
-from odoo import api, fields, models, _
+from odoo import fields, models, _
 
 _logger = logging.getLogger(__name__)
 
@@ -13,14 +13,27 @@ class ResPartner(models.Model):
     zalo_opt_in_date = fields.Datetime('Opt-in Date', readonly=True,
                                       help='Date when customer opted in to Zalo messaging')
     
-    zns_history_count = fields.Integer('ZNS Message Count', compute='_compute_zns_history_count')
+    zns_history_count = fields.Integer('ZNS Message Count', default=0, readonly=True, copy=False,
+                                       help='Number of ZNS messages sent to this partner, maintained by the message history')
     
-    @api.depends('zalo_phone', 'phone', 'mobile')
-    def _compute_zns_history_count(self):
-        """Compute the number of ZNS messages sent to this partner"""
-        for partner in self:
-            domain = [('partner_id', '=', partner.id)]
-            partner.zns_history_count = self.env['bom.zns.history'].search_count(domain)
+    def init(self):
+        # Resynchronize the counters, e.g. on install or after partners were merged
+        self.env.cr.execute("""
+            UPDATE res_partner p
+               SET zns_history_count = c.count
+              FROM (SELECT partner_id, count(*) AS count
+                      FROM bom_zns_history
+                     WHERE partner_id IS NOT NULL
+                  GROUP BY partner_id) AS c
+             WHERE p.id = c.partner_id
+               AND p.zns_history_count IS DISTINCT FROM c.count
+        """)
+        self.env.cr.execute("""
+            UPDATE res_partner p
+               SET zns_history_count = 0
+             WHERE p.zns_history_count != 0
+               AND NOT EXISTS (SELECT 1 FROM bom_zns_history h WHERE h.partner_id = p.id)
+        """)
     
     def write(self, vals):
         """Override write to track opt-in changes"""
@@ -22,6 +22,7 @@ odoo.define('bom_zns_simple.zns_widget', function (require) {
             this._super.apply(this, arguments);
             this.statusColors = {
                 'draft': 'secondary',
+                'queued': 'light',
                 'sent': 'info',
                 'delivered': 'warning',
                 'read': 'success',
@@ -29,6 +30,7 @@ odoo.define('bom_zns_simple.zns_widget', function (require) {
             };
             this.statusLabels = {
                 'draft': _t('Draft'),
+                'queued': _t('Queued'),
                 'sent': _t('Sent'),
                 'delivered': _t('Delivered'),
                 'read': _t('Read'),
@@ -89,11 +89,8 @@ class BomZnsSendWizard(models.TransientModel):
         for variant_line in self.variant_ids:
             params[variant_line.param_name] = variant_line.value
         
-        # Initialize ZNS API
-        zns_api = self.env['bom.zns'].create({})
-        
         # Send message
-        result = zns_api.send_zns_message(
+        result = self.env['bom.zns'].send_zns_message(
             template_id=self.template_id.id,
             phone=self.phone,
             params=params,